@@ -0,0 +1,779 @@
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+import httpx
+from aiohttp import web
+from fastapi.encoders import jsonable_encoder
+
+import fixtures
+import main as api
+import metrics
+import parsing
+from cache import CACHE_TTLS, ResponseCache
+from catalog_index import RECENTLY_UPDATED_SORT
+from catalog_search import CatalogSearch, tokenize
+from cursors import Cursor, encode_cursor
+from page_store import PageStore
+from records import CatalogItem, GameDetails
+from upstream import CircuitBreaker, HostLimiter, UpstreamClient, UpstreamError, UpstreamUnavailable
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PARSER_BACKENDS = [
+    ('html5lib', False),
+    ('html.parser', False),
+    ('html.parser', True),
+    ('lxml', False),
+    ('lxml', True),
+]
+
+
+def timed(function: Callable, repeat: int) -> float:
+    # Best of `repeat` runs, in seconds
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def extract_catalog(pages: List[str], parser: str, partial: bool) -> List[Dict]:
+    items = []
+    for page in pages:
+        soup = parsing.make_soup(page, parsing.CATALOG_LISTING, parser=parser, partial=partial)
+        items.extend(parsing.process_item(item) for item in soup.find_all(class_='item-card'))
+    return items
+
+
+def extract_game(page: str, parser: str, partial: bool) -> Dict:
+    return parsing.process_game_details(parsing.make_soup(page, parser=parser, partial=partial))
+
+
+def bench_parsers(args):
+    items = fixtures.load_items()
+    catalog_pages = fixtures.catalog_pages(items)
+    game_page = fixtures.render_game_page(fixtures.load_game())
+
+    # Every backend has to produce exactly what html5lib produces before it is timed
+    baseline_items = extract_catalog(catalog_pages, 'html5lib', False)
+    baseline_game = extract_game(game_page, 'html5lib', False)
+    if [item.legacy() for item in baseline_items] != items:
+        raise SystemExit("html5lib output does not match item_data.json")
+
+    print(f"{'backend':<22}{'catalog page':>14}{'game page':>14}  parity")
+    for parser, partial in PARSER_BACKENDS:
+        parity = (extract_catalog(catalog_pages, parser, partial) == baseline_items
+                  and extract_game(game_page, parser, partial) == baseline_game)
+        if not parity:
+            raise SystemExit(f"{parser} (partial={partial}) output differs from html5lib")
+
+        catalog_time = timed(lambda: extract_catalog(catalog_pages, parser, partial), args.repeat) / len(catalog_pages)
+        game_time = timed(lambda: extract_game(game_page, parser, partial), args.repeat)
+        name = f"{parser}{' partial' if partial else ''}"
+        print(f"{name:<22}{catalog_time * 1000:>11.2f} ms{game_time * 1000:>11.2f} ms  ok")
+
+    # The fixtures were written to fit the parser, so partial parsing is only trusted
+    # once it reads recorded live listing pages exactly like a full-tree parse does
+    recorded = ([(path, parsing.parse_catalog_listing) for path in args.catalog_page]
+                + [(path, parsing.parse_games_listing) for path in args.games_page])
+    for path, parse_listing in recorded:
+        with open(path, encoding='utf-8') as page_file:
+            markup = page_file.read()
+        full = parse_listing_with(parse_listing, markup, partial=False)
+        partial = parse_listing_with(parse_listing, markup, partial=True)
+        print(f"{path}: {len(full[1])} cards full tree, {len(partial[1])} partial  "
+              f"{'ok' if partial == full else 'FAIL'}")
+        if partial != full:
+            raise SystemExit(f"Partial parsing of {path} differs from the full tree; keep HTML_PARTIAL_PARSING off")
+
+
+def parse_listing_with(parse_listing: Callable, markup: str, partial: bool):
+    default = parsing.HTML_PARTIAL_PARSING
+    parsing.HTML_PARTIAL_PARSING = partial
+    try:
+        return parse_listing(markup)
+    finally:
+        parsing.HTML_PARTIAL_PARSING = default
+
+
+def legacy_process_game_details(game) -> Dict:
+    # process_game_details as it was before the single-pass extractor, kept as the baseline:
+    # every stat walks find_next from the first column, and the game passes come from a
+    # prettify() + re-parse of the whole page
+    stat = game.find('div', class_='col')
+    stats = []
+    for column in range(5):
+        node = stat
+        for _ in range(column):
+            node = node.find_next('div', class_='col')
+        stats.append(node.find_next('h2').get_text(strip=True))
+        stat = game.find('div', class_='col')
+
+    return {
+        "Game Title": game.find('h1', class_='m-0').get_text(strip=True),
+        "Creator Name": game.find('p', class_='m-0').find('a').get_text(strip=True),
+        "Favorites Count": int(game.find('div', class_='icon-favorite').find_next('span', class_='text-favorite').get_text(strip=True)),
+        "Likes Count": int(game.find('div', class_='upvote').find_next('span', class_='vote-up-text').get_text(strip=True)),
+        "Dislikes Count": int(game.find('span', class_='vote-down-text').text),
+        "Description": game.find('div', class_='ms-2').get_text(strip=True),
+        "Builder Club Required": "Yes" if game.find('p', string='A Builders Club membership is required to join this game') else "No",
+        "Thumbnail Source": game.find('img', class_='rounded')['src'],
+        "Active Players": int(stats[0]),
+        "Visits Count": int(stats[1]),
+        "Created Date": stats[2],
+        "Updated Date": stats[3],
+        "Server Size": int(stats[4]),
+        "Game Passes": parsing.extract_game_passes(game.prettify()),
+    }
+
+
+def bench_game_details(args):
+    game = fixtures.load_game()
+    page = fixtures.render_game_page(game)
+
+    if parsing.parse_game_page(page).legacy() != game:
+        raise SystemExit("process_game_details output does not match game_info.json")
+
+    print(f"game_info.json page ({len(page)} bytes), parser {parsing.HTML_PARSER}, best of {args.repeat}")
+    parse_time = timed(lambda: parsing.make_soup(page), args.repeat)
+    soup = parsing.make_soup(page)
+    legacy_time = timed(lambda: legacy_process_game_details(soup), args.repeat)
+    single_pass_time = timed(lambda: parsing.process_game_details(soup), args.repeat)
+
+    print(f"{'parse page':<34}{parse_time * 1000:>9.3f} ms")
+    print(f"{'legacy extraction':<34}{legacy_time * 1000:>9.3f} ms")
+    print(f"{'single-pass extraction':<34}{single_pass_time * 1000:>9.3f} ms")
+    print(f"{'per page, legacy':<34}{(parse_time + legacy_time) * 1000:>9.3f} ms")
+    print(f"{'per page, single-pass':<34}{(parse_time + single_pass_time) * 1000:>9.3f} ms"
+          f"  ({(parse_time + legacy_time) / (parse_time + single_pass_time):.1f}x)")
+
+
+def synthetic_catalog(items: List[CatalogItem], size: int) -> List[CatalogItem]:
+    # item_data.json repeated under fresh asset ids until the catalog holds size items
+    catalog = []
+    for index in range(size):
+        item = items[index % len(items)]
+        link_id, new_id = item.asset_id, 100000 + index
+        catalog.append(CatalogItem(item.name, item.robux, item.tickets, item.price_change, item.limited,
+                                   item.link.replace(f"/{link_id}/", f"/{new_id}/"),
+                                   item.image.replace(f"assetId={link_id}", f"assetId={new_id}")))
+    return catalog
+
+
+def reference_search(items: List[CatalogItem], q: str, sort: int, item_type: 'api.ItemType',
+                     orders: Dict[int, List[int]], offset: int, limit: int) -> List[CatalogItem]:
+    # Brute force version of CatalogSearch.search over the same snapshot
+    words = tokenize(q or '')
+    matches = [item for item in items if api.item_type_filter(item, item_type)
+               and all(any(name_word.startswith(word) for name_word in tokenize(item.name)) for word in words)]
+
+    def price_key(item):
+        # Robux priced (Free is 0 Robux) first, then Tickets-only, then unpriced
+        if item.free or item.robux is not None:
+            return 0, item.robux or 0
+        return (1, item.tickets) if item.tickets is not None else (2, 0)
+
+    if sort == 1:
+        matches.sort(key=price_key)
+    elif sort == 2:
+        matches.sort(key=lambda item: (price_key(item)[0], -price_key(item)[1]))
+    elif sort in orders:
+        rank = {item_id: position for position, item_id in enumerate(orders[sort])}
+        matches.sort(key=lambda item: rank.get(item.asset_id, len(rank)))
+    return matches[offset:offset + limit]
+
+
+def bench_search(args):
+    items = [CatalogItem.from_legacy(item) for item in fixtures.load_items()]
+    search_queries = [
+        ('no filter', None, 0, api.ItemType.all, 0),
+        ('price low to high', None, 1, api.ItemType.all, 0),
+        ('price high to low, limited u', None, 2, api.ItemType.limited_u, 0),
+        ('recently updated, free', None, 3, api.ItemType.free, 0),
+        ('q=hat', 'hat', 0, api.ItemType.all, 0),
+        ('q=hat, price high to low', 'hat', 2, api.ItemType.all, 0),
+        ('q="blue cap", limited', 'blue cap', 0, api.ItemType.limited, 0),
+        ('q=a (wide prefix)', 'a', 1, api.ItemType.all, 0),
+        ('q=the, offset 200', 'the', 0, api.ItemType.all, 200),
+        ('no filter, offset 20000', None, 0, api.ItemType.all, 20000),
+        ('limited, offset 1000', None, 1, api.ItemType.limited, 1000),
+        ('q=hat, limited u, offset 100', 'hat', 1, api.ItemType.limited_u, 100),
+    ]
+
+    # Parity with a brute force search over the real snapshot
+    orders = {RECENTLY_UPDATED_SORT: [item.asset_id for item in reversed(items)]}
+    search = CatalogSearch(items, orders)
+    failures = []
+    for name, q, sort, item_type, offset in search_queries:
+        for limit in (1, 10, 100):
+            expected = reference_search(items, q, sort, item_type, orders, min(offset, 500), limit)
+            if search.search(q, 0, sort, item_type.value, min(offset, 500), limit).items != expected:
+                failures.append(f"{name} (limit={limit})")
+    if failures:
+        raise SystemExit(f"search results differ from the brute force search: {', '.join(failures)}")
+
+    catalog = synthetic_catalog(items, args.items)
+    start = time.perf_counter()
+    search = CatalogSearch(catalog, {RECENTLY_UPDATED_SORT: [item.asset_id for item in reversed(catalog)]})
+    print(f"parity ok; {len(catalog)} items indexed in {(time.perf_counter() - start) * 1000:.0f} ms, "
+          f"{len(search.vocabulary)} tokens, limit={args.limit}")
+
+    print(f"{'query':<34}{'matches':>9}{'p50':>10}{'p99':>10}")
+    slow = []
+    for name, q, sort, item_type, offset in search_queries:
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = search.search(q, 0, sort, item_type.value, offset, args.limit)
+            samples.append(time.perf_counter() - start)
+        p50 = percentile(samples, 0.5)
+        if p50 * 1000 > args.budget_ms:
+            slow.append(name)
+        print(f"{name:<34}{result.total:>9}{p50 * 1e6:>8.0f}us{percentile(samples, 0.99) * 1e6:>8.0f}us"
+              f"{'  SLOW' if p50 * 1000 > args.budget_ms else ''}")
+
+    if slow:
+        raise SystemExit(f"p50 over {args.budget_ms} ms: {', '.join(slow)}")
+
+
+def retained_bytes(build: Callable) -> int:
+    # Memory still allocated by what build() returns, once its temporaries are freed
+    tracemalloc.start()
+    try:
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def bench_records(args):
+    items = fixtures.load_items()
+    game = fixtures.load_game()
+    records = [CatalogItem.from_legacy(item) for item in items]
+
+    # The records must render exactly what the API has always returned
+    if [record.legacy() for record in records] != items:
+        raise SystemExit("CatalogItem.legacy() does not reproduce item_data.json")
+    if GameDetails.from_legacy(game).legacy() != game:
+        raise SystemExit("GameDetails.legacy() does not reproduce game_info.json")
+
+    dump = json.dumps(items)
+    dict_bytes = retained_bytes(lambda: json.loads(dump))
+    record_bytes = retained_bytes(lambda: [CatalogItem.from_legacy(item) for item in json.loads(dump)])
+    print(f"{len(items)} items from item_data.json, parity ok")
+    print(f"{'memory per item':<34}{'dicts':>10}{'records':>10}")
+    print(f"{'':<34}{dict_bytes / len(items):>8.0f} B{record_bytes / len(items):>8.0f} B"
+          f"  ({dict_bytes / record_bytes:.1f}x smaller)")
+
+    print(f"\n{'encode /catalog response':<34}{'dicts':>10}{'legacy':>10}{'compact':>10}  (best of {args.repeat})")
+    for limit in args.limits:
+        data, batch = items[:limit], records[:limit]
+        summary = {"category": "Unknown Category", "sort": "Relevance", "item_type": api.ItemType.all}
+        # Before: dicts through FastAPI's jsonable_encoder, then JSONResponse
+        dict_time = timed(lambda: api.JSONResponse(jsonable_encoder(dict(summary, data=data))), args.repeat)
+        legacy_time = timed(lambda: api.JSONResponse(dict(summary, data=api.shaped(batch, api.RecordShape.legacy))),
+                            args.repeat)
+        compact_time = timed(lambda: api.JSONResponse(dict(summary, data=api.shaped(batch, api.RecordShape.compact))),
+                             args.repeat)
+        print(f"{f'limit={len(batch)}':<34}{dict_time * 1000:>8.2f}ms{legacy_time * 1000:>8.2f}ms"
+              f"{compact_time * 1000:>8.2f}ms  ({dict_time / legacy_time:.1f}x)")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def measure_loop_lag(workload, interval: float = 0.005) -> List[float]:
+    # Sleep for `interval` in a loop while the workload runs and record how late each wake-up was
+    lags = []
+    done = asyncio.Event()
+
+    async def monitor():
+        loop = asyncio.get_running_loop()
+        while not done.is_set():
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, loop.time() - start - interval))
+
+    monitor_task = asyncio.ensure_future(monitor())
+    try:
+        await workload()
+    finally:
+        done.set()
+        await monitor_task
+    return lags
+
+
+def bench_loop_lag(args):
+    pages = fixtures.FixturePages()
+    search_url = "https://www.syntax.eco/catalog/?category=0&sort=0"
+
+    async def catalog_load():
+        # A distinct query per scan (the fixture site ignores it) so concurrent scans don't share their loads
+        upstream = fixtures.FixtureUpstream(pages, latency=args.latency)
+        await asyncio.gather(*(api.get_catalog_page(upstream, f"{search_url}&q=scan{scan}", args.limit, api.ItemType.all)
+                               for scan in range(args.concurrency)))
+
+    def cold_cache():
+        # Every executor scrapes and parses its pages itself instead of reading an earlier run's
+        api.page_cache = ResponseCache(ttls={endpoint: 0 for endpoint in CACHE_TTLS}, stale_while_revalidate=0,
+                                       stale_if_error=0)
+        api.page_store = PageStore(max_entries=0)
+
+    print(f"{args.concurrency} concurrent /catalog scans, limit={args.limit}, upstream latency {args.latency * 1000:.0f} ms")
+    print(f"{'executor':<18}{'wall':>10}{'lag p50':>10}{'lag p99':>10}{'lag max':>10}")
+    page_cache, page_store = api.page_cache, api.page_store
+    for kind in args.executors:
+        parsing.parse_pool = parsing.ParsePool(kind, args.workers)
+        parsing.parse_pool.start()
+        try:
+            # Warm up the workers (process start-up, imports) before measuring
+            cold_cache()
+            asyncio.run(api.get_catalog_page(fixtures.FixtureUpstream(pages), search_url, 1, api.ItemType.all))
+            cold_cache()
+            start = time.perf_counter()
+            lags = asyncio.run(measure_loop_lag(catalog_load))
+            wall = time.perf_counter() - start
+        finally:
+            parsing.parse_pool.close()
+            parsing.parse_pool = parsing.ParsePool('inline')
+            api.page_cache, api.page_store = page_cache, page_store
+
+        name = f"{kind} ({args.workers})" if kind != 'inline' else kind
+        print(f"{name:<18}{wall:>9.2f}s{percentile(lags, 0.5) * 1000:>8.1f}ms"
+              f"{percentile(lags, 0.99) * 1000:>8.1f}ms{max(lags, default=0) * 1000:>8.1f}ms")
+
+
+def catalog_page_budget(items: List[Dict], limit: int, item_type: 'api.ItemType') -> int:
+    # Listing pages a /catalog call needs: the page holding the limit-th matching item,
+    # plus the prefetch window when a filter makes the page count unpredictable
+    matches = [index for index, item in enumerate(items)
+               if api.item_type_filter(CatalogItem.from_legacy(item), item_type)]
+    last_index = matches[limit - 1] if len(matches) >= limit else len(items) - 1
+    pages_needed = last_index // fixtures.CATALOG_PAGE_SIZE + 1
+    if item_type != api.ItemType.all:
+        pages_needed += api.CATALOG_MAX_INFLIGHT_PAGES
+    return min(pages_needed, -(-len(items) // fixtures.CATALOG_PAGE_SIZE))
+
+
+async def count_upstream_requests(upstream: 'fixtures.FixtureUpstream', path: str, body: Dict = None):
+    # Invoke one endpoint against the fixture upstream with a cold page cache (POST if there is a body)
+    api.page_cache.clear()
+    api.page_store.clear()
+    api.app.state.upstream = upstream
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://api') as client:
+        response = await client.post(path, json=body) if body is not None else await client.get(path)
+    response.raise_for_status()
+    return response.json()
+
+
+def bench_upstream_requests(args):
+    pages = fixtures.FixturePages()
+    catalog_params = {'category': 0, 'sort': 0, 'limit': 500, 'item_type': 'all'}
+    cases = [
+        ('/catalog?limit=10', catalog_page_budget(pages.items, 10, api.ItemType.all), {}),
+        ('/catalog?limit=100', catalog_page_budget(pages.items, 100, api.ItemType.all), {}),
+        ('/catalog?limit=500', catalog_page_budget(pages.items, 500, api.ItemType.all), {}),
+        ('/catalog?limit=20&item_type=limited_u', catalog_page_budget(pages.items, 20, api.ItemType.limited_u), {}),
+        ('/games?limit=5', 1 + 5, {'game detail': 5}),
+        ('/games?limit=30', -(-30 // fixtures.GAMES_PAGE_SIZE) + 30, {'game detail': 30}),
+        # Ten games, one of them asked for twice, and one id the fixture site doesn't have
+        ('/games/batch', 11, {'game detail': 11, 'games listing': 0},
+         {'ids': [fixtures.FIRST_GAME_ID + index for index in range(10)] + [fixtures.FIRST_GAME_ID, 1]}),
+        # Resuming deep into a listing only fetches the pages from the cursor on
+        # (item 500 is card 500 % page size of page 500 // page size + 1)
+        ('/catalog?limit=10&cursor=' + encode_cursor(Cursor('catalog', catalog_params, 500 // fixtures.CATALOG_PAGE_SIZE + 1,
+                                                            500 % fixtures.CATALOG_PAGE_SIZE)),
+         2, {'catalog listing': 2}),
+        ('/games?limit=5&cursor=' + encode_cursor(Cursor('games', {'limit': 30}, page=2)),
+         1 + 5, {'games listing': 1, 'game detail': 5}),
+    ]
+
+    failures = []
+    print(f"{'invocation':<42}{'requests':>9}{'budget':>8}  per page kind")
+    for path, budget, exact, *body in cases:
+        upstream = fixtures.FixtureUpstream(pages)
+        asyncio.run(count_upstream_requests(upstream, path, *body))
+        total = sum(upstream.requests.values())
+        repeated = [url for url, count in upstream.urls.items() if count > 1]
+
+        problems = []
+        if total > budget:
+            problems.append(f"{total} upstream requests, budget is {budget}")
+        if repeated:
+            problems.append(f"fetched more than once: {', '.join(repeated)}")
+        problems.extend(f"{upstream.requests[kind]} {kind} requests, expected {count}"
+                        for kind, count in exact.items() if upstream.requests[kind] != count)
+        failures.extend(f"{path}: {problem}" for problem in problems)
+
+        kinds = ', '.join(f"{kind}={count}" for kind, count in sorted(upstream.requests.items()))
+        label = path.split('&cursor=')[0] + '&cursor=...' if '&cursor=' in path else path
+        print(f"{label:<42}{total:>9}{budget:>8}  {kinds}{'  FAIL' if problems else ''}")
+
+    if failures:
+        raise SystemExit('\n'.join(failures))
+
+
+async def run_resilience_checks(args) -> List[str]:
+    # Drives the per-host limiter and circuit breaker against a local server whose
+    # status and Retry-After can be switched between requests
+    failures = []
+    server = {'status': 200, 'retry_after': None, 'requests': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    async def handle(request: web.Request) -> web.Response:
+        server['requests'] += 1
+        server['in_flight'] += 1
+        server['max_in_flight'] = max(server['max_in_flight'], server['in_flight'])
+        try:
+            await asyncio.sleep(args.latency)
+        finally:
+            server['in_flight'] -= 1
+        headers = {'Retry-After': str(server['retry_after'])} if server['retry_after'] is not None else {}
+        return web.Response(status=server['status'], text='ok', headers=headers)
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handle)
+    runner = await fixtures.start_stand_in(app)
+    url = f"{fixtures.stand_in_url(runner)}/page"
+
+    def check(name: str, ok: bool, detail: str):
+        print(f"{name:<48}{'ok' if ok else 'FAIL'}  {detail}")
+        if not ok:
+            failures.append(f"{name}: {detail}")
+
+    client = UpstreamClient(
+        retry_total=1, retry_backoff_factor=0,
+        host_limiter=lambda: HostLimiter(rate=20, burst=5, initial_concurrency=4, max_concurrency=4),
+        circuit_breaker=lambda: CircuitBreaker(failure_threshold=3, reset_timeout=0.3))
+    await client.start()
+    try:
+        limiter, breaker = client.host(url)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client.get(url) for _ in range(15)))
+        elapsed = time.perf_counter() - start
+        check("concurrency capped per host", server['max_in_flight'] <= 4, f"{server['max_in_flight']} in flight, cap 4")
+        check("rate limited per host", elapsed >= (15 - 5) / 20 * 0.9, f"15 requests in {elapsed:.2f}s at 20/s, burst 5")
+
+        server.update(status=429, retry_after=0.3)
+        start = time.perf_counter()
+        response = await client.get(url)
+        elapsed = time.perf_counter() - start
+        check("429 retried after Retry-After", response.status == 429 and elapsed >= 0.3,
+              f"status {response.status} after {elapsed:.2f}s, Retry-After 0.3s")
+
+        server.update(status=503, retry_after=None)
+        while breaker.state == 'closed':
+            try:
+                await client.get(url)
+            except UpstreamUnavailable:
+                pass  # opened between a failure and its retry
+        requests = server['requests']
+        try:
+            await client.get(url)
+            rejected = False
+        except UpstreamUnavailable:
+            rejected = True
+        check("open breaker fails fast", rejected and server['requests'] == requests,
+              f"rejected={rejected}, {server['requests'] - requests} requests sent")
+
+        # A probe cancelled while it waits for the limiter (or for its response) must not wedge the breaker
+        server.update(status=200)
+        for stage in ('limiter', 'fetch'):
+            await asyncio.sleep(breaker.reset_timeout)
+            if stage == 'limiter':
+                limiter.pause(0.2)
+            probe = asyncio.ensure_future(client.get(url))
+            await asyncio.sleep(args.latency / 2 if stage == 'fetch' else 0.05)
+            probe.cancel()
+            await asyncio.gather(probe, return_exceptions=True)
+            check(f"probe cancelled in {stage} releases the breaker", not breaker.probing and limiter.in_flight == 0,
+                  f"state {breaker.state}, probing={breaker.probing}, in flight {limiter.in_flight}")
+        await asyncio.sleep(0.2)
+        try:
+            status = (await client.get(url)).status
+        except UpstreamUnavailable:
+            status = None
+        check("breaker closes after a good probe", status == 200 and breaker.state == 'closed',
+              f"status {status}, state {breaker.state}")
+
+        # Nothing listens on a port just released, so every attempt fails to connect
+        with socket.socket() as listener:
+            listener.bind(('127.0.0.1', 0))
+            unreachable = f"http://127.0.0.1:{listener.getsockname()[1]}/page"
+        try:
+            await client.get(unreachable)
+            error = None
+        except Exception as e:
+            error = e
+        check("connection failure raises UpstreamError", isinstance(error, UpstreamError) and error.status == 502,
+              f"raised {error!r}")
+    finally:
+        await client.close()
+        await runner.cleanup()
+    return failures
+
+
+def bench_upstream_resilience(args):
+    failures = asyncio.run(run_resilience_checks(args))
+    if failures:
+        raise SystemExit('\n'.join(failures))
+
+
+def summarize(name: str, samples: List[float], unit: str = 'ms', scale: float = 1000):
+    mean = sum(samples) / len(samples) if samples else 0.0
+    print(f"{name:<28}{len(samples):>7}{mean * scale:>10.3f}{percentile(samples, 0.5) * scale:>10.3f}"
+          f"{percentile(samples, 0.99) * scale:>10.3f} {unit}")
+
+
+async def stage_timings(client: UpstreamClient, base_url: str, pages: 'fixtures.FixturePages', args):
+    # Times each pipeline stage on its own against the stand-in
+    samples = defaultdict(list)
+    catalog_urls = [f"{base_url}/catalog/?page={page_number}" for page_number in range(1, pages.catalog_total_pages + 1)]
+    game_urls = [f"{base_url}/games/{fixtures.FIRST_GAME_ID + index}/" for index in range(args.sample_games)]
+
+    catalog_markup, game_markup = [], []
+    for url in catalog_urls + game_urls:
+        start = time.perf_counter()
+        response = await client.get(url)
+        samples['fetch'].append(time.perf_counter() - start)
+        (catalog_markup if '/catalog/' in url else game_markup).append(response.text)
+
+    items = []
+    for markup in catalog_markup:
+        start = time.perf_counter()
+        soup = parsing.make_soup(markup, parsing.CATALOG_LISTING)
+        samples['parse (catalog page)'].append(time.perf_counter() - start)
+        for item in soup.find_all(class_='item-card'):
+            start = time.perf_counter()
+            items.append(parsing.process_item(item))
+            samples['process_item'].append(time.perf_counter() - start)
+
+    for markup in game_markup:
+        start = time.perf_counter()
+        soup = parsing.make_soup(markup)
+        samples['parse (game page)'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        parsing.process_game_details(soup)
+        samples['process_game_details'].append(time.perf_counter() - start)
+
+    for limit in args.catalog_limits:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            api.JSONResponse({"data": api.shaped(items[:limit], api.RecordShape.legacy), "category": "Unknown Category",
+                              "sort": "Relevance", "item_type": api.ItemType.all})
+            samples[f'serialize (limit={limit})'].append(time.perf_counter() - start)
+
+    print(f"{'stage':<28}{'samples':>7}{'mean':>10}{'p50':>10}{'p99':>10}")
+    for name, values in samples.items():
+        summarize(name, values)
+
+
+class NoFlight:
+    # Stands in for a cache's SingleFlight so concurrent loads of the same page each run
+    coalesced = 0
+    calls: Dict = {}
+
+    async def do(self, key, loader: Callable):
+        return await loader()
+
+
+async def end_to_end(path: str, args) -> List[float]:
+    # Latency of each of args.requests calls to path, args.concurrency at a time
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=api.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://api', timeout=None) as client:
+        async def call():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(call() for _ in range(args.requests)))
+    return latencies
+
+
+async def run_suite(args):
+    pages = fixtures.FixturePages()
+    app = fixtures.stand_in_app(pages, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=0)
+    runner = await fixtures.start_stand_in(app)
+    base_url = fixtures.stand_in_url(runner)
+
+    client = UpstreamClient(retry_backoff_factor=args.retry_backoff)
+    await client.start()
+    upstream_url, page_cache, page_store = api.UPSTREAM_URL, api.page_cache, api.page_store
+    api.UPSTREAM_URL = base_url
+    api.app.state.upstream = client
+    if not args.cache:
+        # Every call misses and loads its own pages, so each one measures a full scrape
+        api.page_cache = ResponseCache(ttls={endpoint: 0 for endpoint in CACHE_TTLS}, stale_while_revalidate=0,
+                                       stale_if_error=0)
+        api.page_cache.flights = NoFlight()
+        # and is neither revalidated nor spared its parse
+        api.page_store = PageStore(max_entries=0)
+    parsing.parse_pool = parsing.ParsePool(args.executor, args.workers)
+    parsing.parse_pool.start()
+
+    try:
+        print(f"stand-in at {base_url}: latency {args.latency * 1000:.0f} ms (+{args.jitter * 1000:.0f} ms jitter), "
+              f"error rate {args.error_rate:.0%}; parse executor {args.executor}; cache {'on' if args.cache else 'off'}\n")
+        await stage_timings(client, base_url, pages, args)
+
+        print(f"\n{'endpoint':<28}{'requests':>9}{'req/s':>9}{'p50':>10}{'p99':>10}{'pages/req':>11}")
+        paths = ([f"/catalog?limit={limit}" for limit in args.catalog_limits]
+                 + [f"/games?limit={limit}" for limit in args.games_limits])
+        for path in paths:
+            app['requests'].clear()
+            start = time.perf_counter()
+            latencies = await end_to_end(path, args)
+            wall = time.perf_counter() - start
+            print(f"{path:<28}{len(latencies):>9}{len(latencies) / wall:>9.1f}"
+                  f"{percentile(latencies, 0.5) * 1000:>8.0f}ms{percentile(latencies, 0.99) * 1000:>8.0f}ms"
+                  f"{sum(app['requests'].values()) / len(latencies):>11.1f}  upstream: {dict(app['requests'])}")
+    finally:
+        parsing.parse_pool.close()
+        parsing.parse_pool = parsing.ParsePool('inline')
+        api.UPSTREAM_URL, api.page_cache, api.page_store = upstream_url, page_cache, page_store
+        await client.close()
+        await runner.cleanup()
+
+
+def bench_suite(args):
+    asyncio.run(run_suite(args))
+
+
+def parse_count() -> int:
+    return sum(sum(counts) for counts, _ in metrics.PARSE_SECONDS.series.values())
+
+
+async def run_revalidation(args):
+    pages = fixtures.FixturePages()
+    runner = await fixtures.start_stand_in(fixtures.stand_in_app(pages, latency=args.latency, seed=0))
+    # Not throttled, so wall times are down to fetching and parsing
+    client = UpstreamClient(host_limiter=lambda: HostLimiter(rate=10000, burst=10000))
+    await client.start()
+    upstream_url, page_cache, page_store = api.UPSTREAM_URL, api.page_cache, api.page_store
+    api.UPSTREAM_URL = fixtures.stand_in_url(runner)
+    api.app.state.upstream = client
+    # Every call reloads its pages, as it would once their cache TTLs have run out
+    api.page_cache = ResponseCache(ttls={endpoint: 0 for endpoint in CACHE_TTLS}, stale_while_revalidate=0,
+                                   stale_if_error=0)
+
+    try:
+        print(f"stand-in latency {args.latency * 1000:.0f} ms; every call reloads its pages\n")
+        print(f"{'endpoint':<24}{'page store':>11}{'call':>8}{'wall':>10}{'parses':>8}{'304s':>6}{'unchanged':>10}")
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://api', timeout=None) as http:
+            for path in args.paths:
+                for store in (False, True):
+                    api.page_store = PageStore() if store else PageStore(max_entries=0)
+                    for call in ('first', 'reload'):
+                        parses, counters = parse_count(), dict(api.page_store.counters)
+                        start = time.perf_counter()
+                        (await http.get(path)).raise_for_status()
+                        wall = time.perf_counter() - start
+                        print(f"{path:<24}{'on' if store else 'off':>11}{call:>8}{wall * 1000:>8.0f}ms"
+                              f"{parse_count() - parses:>8}"
+                              f"{api.page_store.counters['not_modified'] - counters['not_modified']:>6}"
+                              f"{api.page_store.counters['unchanged'] - counters['unchanged']:>10}")
+    finally:
+        api.UPSTREAM_URL, api.page_cache, api.page_store = upstream_url, page_cache, page_store
+        await client.close()
+        await runner.cleanup()
+
+
+def bench_revalidation(args):
+    asyncio.run(run_revalidation(args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the SyntaxPY scraping pipeline")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parsers_command = subparsers.add_parser('parsers', help="Check parser backend parity and time parse + extract")
+    parsers_command.add_argument('--repeat', type=int, default=3)
+    parsers_command.add_argument('--catalog-page', nargs='*', default=[],
+                                 help="Saved live catalog listing pages to check partial parsing against")
+    parsers_command.add_argument('--games-page', nargs='*', default=[],
+                                 help="Saved live games listing pages to check partial parsing against")
+    parsers_command.set_defaults(func=bench_parsers)
+
+    details_command = subparsers.add_parser('game-details', help="Per-page game detail extraction cost, legacy vs single-pass")
+    details_command.add_argument('--repeat', type=int, default=50)
+    details_command.set_defaults(func=bench_game_details)
+
+    search_command = subparsers.add_parser('search', help="Check local catalog search against brute force and time queries")
+    search_command.add_argument('--items', type=int, default=50000, help="Size of the synthetic catalog")
+    search_command.add_argument('--limit', type=int, default=10)
+    search_command.add_argument('--repeat', type=int, default=200)
+    search_command.add_argument('--budget-ms', type=float, default=1.0, help="Fail if a query's p50 is over this")
+    search_command.set_defaults(func=bench_search)
+
+    records_command = subparsers.add_parser('records', help="Per-item memory and response encode time, dicts vs records")
+    records_command.add_argument('--limits', type=int, nargs='+', default=[10, 100, 500, 1191])
+    records_command.add_argument('--repeat', type=int, default=20)
+    records_command.set_defaults(func=bench_records)
+
+    lag_command = subparsers.add_parser('loop-lag', help="Event loop lag under concurrent /catalog load per parse executor")
+    lag_command.add_argument('--concurrency', type=int, default=8)
+    lag_command.add_argument('--limit', type=int, default=500)
+    lag_command.add_argument('--latency', type=float, default=0.02, help="Simulated upstream round trip in seconds")
+    lag_command.add_argument('--workers', type=int, default=parsing.PARSE_WORKERS)
+    lag_command.add_argument('--executors', nargs='+', default=['inline', 'thread', 'process'],
+                             choices=['inline', 'thread', 'process'])
+    lag_command.set_defaults(func=bench_loop_lag)
+
+    requests_command = subparsers.add_parser('upstream-requests',
+                                             help="Count upstream requests per endpoint invocation and fail on regressions")
+    requests_command.set_defaults(func=bench_upstream_requests)
+
+    revalidation_command = subparsers.add_parser('revalidation',
+                                                 help="Reload cost of expired pages with and without the raw page store")
+    revalidation_command.add_argument('--latency', type=float, default=0.02, help="Stand-in response latency in seconds")
+    revalidation_command.add_argument('--paths', nargs='+', default=['/catalog?limit=500', '/games?limit=20'])
+    revalidation_command.set_defaults(func=bench_revalidation)
+
+    resilience_command = subparsers.add_parser('upstream-resilience',
+                                               help="Check the per-host throttle and circuit breaker and fail on regressions")
+    resilience_command.add_argument('--latency', type=float, default=0.05, help="Local server response latency in seconds")
+    resilience_command.set_defaults(func=bench_upstream_resilience)
+
+    suite_command = subparsers.add_parser('suite', help="Per-stage timings and end-to-end latency against a local stand-in")
+    suite_command.add_argument('--latency', type=float, default=0.05, help="Stand-in response latency in seconds")
+    suite_command.add_argument('--jitter', type=float, default=0.02, help="Extra random latency in seconds")
+    suite_command.add_argument('--error-rate', type=float, default=0.0, help="Fraction of stand-in responses that fail")
+    suite_command.add_argument('--retry-backoff', type=float, default=0.01)
+    suite_command.add_argument('--executor', default=parsing.PARSE_EXECUTOR, choices=['inline', 'thread', 'process'])
+    suite_command.add_argument('--workers', type=int, default=parsing.PARSE_WORKERS)
+    suite_command.add_argument('--cache', action='store_true', help="Keep the page cache on between calls")
+    suite_command.add_argument('--requests', type=int, default=20, help="Calls per endpoint and limit")
+    suite_command.add_argument('--concurrency', type=int, default=4)
+    suite_command.add_argument('--catalog-limits', type=int, nargs='+', default=[10, 100, 500])
+    suite_command.add_argument('--games-limits', type=int, nargs='+', default=[5, 20])
+    suite_command.add_argument('--sample-games', type=int, default=20, help="Game pages used for stage timings")
+    suite_command.add_argument('--repeat', type=int, default=20, help="Serialization runs per limit")
+    suite_command.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
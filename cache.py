@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of cached pages before the least recently used ones are evicted
+CACHE_MAX_ENTRIES = 2048
+# Seconds a cached page is served as fresh, per endpoint
+CACHE_TTLS = {
+    'catalog': 300,
+    'games': 120,
+    'game': 600,
+}
+DEFAULT_TTL = 60
+# Seconds after expiry during which the stale page is still served while it is refreshed in the background
+CACHE_STALE_WHILE_REVALIDATE = 600
+# Seconds after expiry during which the page is still served if loading a fresh one fails
+CACHE_STALE_IF_ERROR = 3600
+
+
+def normalize_url(url: str) -> str:
+    # Same page, same key: lower-case scheme and host, drop empty parameters and sort the rest
+    parts = urlsplit(url)
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if value != '')
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', urlencode(query), ''))
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    expires_at: float
+    stale_until: float
+    error_until: float
+
+
+class InFlight:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    # Concurrent loads of the same key share one in-flight call. The call runs in its
+    # own task, so a caller being cancelled (e.g. because its client disconnected)
+    # does not cancel it for the others; it is only cancelled once every caller is gone.
+
+    def __init__(self):
+        self.calls: Dict[Hashable, InFlight] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        call = self.calls.get(key)
+        if call is None:
+            call = self.calls[key] = InFlight(asyncio.ensure_future(loader()))
+            call.task.add_done_callback(lambda _: self.forget(key, call))
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # The last caller went away; nobody is left to use the result
+                self.forget(key, call)
+                call.task.cancel()
+
+    def forget(self, key: Hashable, call: InFlight):
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+
+class ResponseCache:
+    # Size bounded LRU cache with a per-endpoint TTL, stale-while-revalidate and
+    # stale-if-error. Values are opaque, so raw page text and parsed items can both be stored.
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttls: Dict[str, float] = None,
+                 stale_while_revalidate: float = CACHE_STALE_WHILE_REVALIDATE,
+                 stale_if_error: float = CACHE_STALE_IF_ERROR, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttls = dict(CACHE_TTLS if ttls is None else ttls)
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self.clock = clock
+        self.entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self.refreshing: Dict[Hashable, asyncio.Task] = {}
+        self.flights = SingleFlight()
+        self.counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'evictions': 0, 'refreshes': 0, 'refresh_errors': 0,
+                         'stale_if_error': 0}
+
+    def key(self, endpoint: str, url: str, variant: str = '') -> Hashable:
+        return endpoint, variant, normalize_url(url)
+
+    def get(self, key: Hashable, allow_stale: bool = False) -> Optional[CacheEntry]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        now = self.clock()
+        if now >= entry.stale_until or (now >= entry.expires_at and not allow_stale):
+            if now >= entry.error_until:
+                del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key: Hashable, value: Any, endpoint: str):
+        expires_at = self.clock() + self.ttls.get(endpoint, DEFAULT_TTL)
+        self.entries[key] = CacheEntry(value, expires_at, expires_at + self.stale_while_revalidate,
+                                       expires_at + max(self.stale_while_revalidate, self.stale_if_error))
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    async def get_or_load(self, endpoint: str, url: str, loader: Callable[[], Awaitable[Any]], variant: str = ''):
+        # Returns the cached value for url, loading (and caching) it on a miss. A value
+        # past its TTL but inside the stale window is returned as is and refreshed in
+        # the background. Concurrent misses for the same key share a single load, and
+        # exceptions raised by loader are never cached: if a load fails while an older
+        # value is inside the stale-if-error window, that value is returned instead.
+        key = self.key(endpoint, url, variant)
+        entry = self.get(key, allow_stale=True)
+
+        if entry is not None:
+            if self.clock() < entry.expires_at:
+                self.counters['hits'] += 1
+            else:
+                self.counters['stale_hits'] += 1
+                self.refresh(key, endpoint, loader)
+            return entry.value
+
+        self.counters['misses'] += 1
+        try:
+            return await self.flights.do(key, self.storing(key, endpoint, loader))
+        except Exception as e:
+            entry = self.entries.get(key)
+            if entry is None or self.clock() >= entry.error_until:
+                raise
+            self.counters['stale_if_error'] += 1
+            logger.warning(f"Serving an expired copy of {key[-1]}: {e}")
+            return entry.value
+
+    def storing(self, key: Hashable, endpoint: str, loader: Callable[[], Awaitable[Any]]):
+        async def load():
+            value = await loader()
+            self.set(key, value, endpoint)
+            return value
+
+        return load
+
+    def refresh(self, key: Hashable, endpoint: str, loader: Callable[[], Awaitable[Any]]):
+        if key in self.refreshing:
+            return
+
+        async def run():
+            try:
+                await self.flights.do(key, self.storing(key, endpoint, loader))
+                self.counters['refreshes'] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters['refresh_errors'] += 1
+                logger.error(f"Failed to refresh cached page {key[-1]}: {e}")
+            finally:
+                self.refreshing.pop(key, None)
+
+        self.refreshing[key] = asyncio.ensure_future(run())
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counters, coalesced=self.flights.coalesced, in_flight=len(self.flights.calls),
+                    entries=len(self.entries), max_entries=self.max_entries, refreshing=len(self.refreshing))
+
+    async def close(self):
+        # Cancel background refreshes still running
+        tasks = list(self.refreshing.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial as bind
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from records import CatalogItem
+
+logger = logging.getLogger(__name__)
+
+# SQLite file the local catalog index is kept in; the index (and its crawler) is off when unset
+CATALOG_INDEX_PATH = os.environ.get('CATALOG_INDEX_PATH')
+# Seconds between incremental refreshes of the index
+CATALOG_REFRESH_INTERVAL = float(os.environ.get('CATALOG_REFRESH_INTERVAL', 600))
+# Seconds between full crawls, which also drop items that left the catalog
+CATALOG_FULL_CRAWL_INTERVAL = float(os.environ.get('CATALOG_FULL_CRAWL_INTERVAL', 86400))
+# A refresh stops after this many consecutive known, unchanged items (one listing page)
+CATALOG_KNOWN_RUN = 36
+
+# Listing sort orders (main.SORT_DICT) the crawler walks
+RELEVANCE_SORT = 0
+RECENTLY_UPDATED_SORT = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    asset_id INTEGER PRIMARY KEY,
+    relevance_rank INTEGER,
+    updated_seq INTEGER NOT NULL DEFAULT 0,
+    first_seen REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_relevance ON items (relevance_rank);
+CREATE INDEX IF NOT EXISTS items_updated ON items (updated_seq);
+CREATE TABLE IF NOT EXISTS crawl_state (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+# Indexes made while /catalog was answered with SQL also have the columns it filtered
+# and sorted on; the rows are copied into a table without them
+DROP_QUERY_COLUMNS = f"""
+BEGIN;
+DROP INDEX IF EXISTS items_robux;
+DROP INDEX IF EXISTS items_relevance;
+DROP INDEX IF EXISTS items_updated;
+ALTER TABLE items RENAME TO items_old;
+{SCHEMA}
+INSERT INTO items (asset_id, relevance_rank, updated_seq, first_seen, updated_at, data)
+    SELECT asset_id, relevance_rank, updated_seq, first_seen, updated_at, data FROM items_old;
+DROP TABLE items_old;
+COMMIT;
+"""
+
+
+def encode_item(item: CatalogItem) -> str:
+    return json.dumps(item.legacy(), ensure_ascii=False, separators=(',', ':'))
+
+
+class CatalogStore:
+    # On-disk index of processed catalog items (parsing.process_item records), keyed
+    # by the asset id in their link. Rows keep the item in its legacy JSON shape with its
+    # place in the two listings the crawler walks; searching is left to CatalogSearch.
+    #
+    # From the app, go through call(): it runs store work on the store's own thread,
+    # one call at a time, so neither SQLite nor decoding a snapshot blocks the event loop.
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(items)")}
+        self.db.executescript(DROP_QUERY_COLUMNS if 'item_name' in columns else SCHEMA)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog-index')
+
+    async def call(self, function: Callable, *args) -> Any:
+        # Run function(*args) (a store method, or anything else using the store) on the store's thread
+        return await asyncio.get_running_loop().run_in_executor(self.executor, bind(function, *args))
+
+    def close(self):
+        # Waits for calls still running
+        self.executor.shutdown(wait=True)
+        self.db.close()
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def state(self, name: str) -> Optional[float]:
+        row = self.db.execute("SELECT value FROM crawl_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, name: str, value: float):
+        self.db.execute("INSERT INTO crawl_state (name, value) VALUES (?, ?) "
+                        "ON CONFLICT (name) DO UPDATE SET value = excluded.value", (name, value))
+
+    def is_known(self, item: CatalogItem) -> bool:
+        # True if the item is indexed exactly as given
+        row = self.db.execute("SELECT data FROM items WHERE asset_id = ?", (item.asset_id,)).fetchone()
+        return row is not None and row[0] == encode_item(item)
+
+    def upsert(self, item: CatalogItem, now: float, relevance_rank: Optional[int] = None, updated_seq: Optional[int] = None):
+        # Insert or update one item; a rank or sequence of None keeps the stored one
+        data = encode_item(item)
+        self.db.execute(
+            "INSERT INTO items (asset_id, relevance_rank, updated_seq, first_seen, updated_at, data)"
+            " VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (asset_id) DO UPDATE SET"
+            " relevance_rank = COALESCE(?, relevance_rank), updated_seq = COALESCE(?, updated_seq),"
+            " updated_at = CASE WHEN data = excluded.data THEN updated_at ELSE excluded.updated_at END,"
+            " data = excluded.data",
+            (item.asset_id, relevance_rank, updated_seq or 0, now, now, data, relevance_rank, updated_seq),
+        )
+
+    def replace_listing(self, items: Iterable[CatalogItem]) -> int:
+        # Store a complete relevance ordered listing (a full crawl or an item_data.json
+        # dump): ranks follow the listing and items missing from it are dropped.
+        # Returns the number of items stored.
+        now = self.clock()
+        seen = set()
+        with self.db:
+            for rank, item in enumerate(items):
+                item_id = item.asset_id
+                if item_id is None or item_id in seen:
+                    continue
+                seen.add(item_id)
+                self.upsert(item, now, relevance_rank=rank)
+
+            self.db.execute("CREATE TEMP TABLE IF NOT EXISTS listed (asset_id INTEGER PRIMARY KEY)")
+            self.db.execute("DELETE FROM listed")
+            self.db.executemany("INSERT INTO listed VALUES (?)", ((item_id,) for item_id in seen))
+            self.db.execute("DELETE FROM items WHERE asset_id NOT IN (SELECT asset_id FROM listed)")
+            self.set_state('full_crawl', now)
+        return len(seen)
+
+    def record_updates(self, items: List[CatalogItem]):
+        # Store items read from the "Recently Updated" listing, most recent first. They
+        # are ordered ahead of everything indexed so far, keeping the listing's order.
+        now = self.clock()
+        with self.db:
+            latest = self.db.execute("SELECT COALESCE(MAX(updated_seq), 0) FROM items").fetchone()[0]
+            for position, item in enumerate(items):
+                if item.asset_id is not None:
+                    self.upsert(item, now, updated_seq=latest + len(items) - position)
+            self.set_state('refresh', now)
+
+    def snapshot(self) -> Tuple[List[CatalogItem], Dict[int, List[int]]]:
+        # The indexed items in relevance order, and the asset ids in "Recently Updated" order
+        items = [CatalogItem.from_legacy(json.loads(data)) for data, in self.db.execute(
+            "SELECT data FROM items ORDER BY relevance_rank IS NULL, relevance_rank, asset_id DESC")]
+        recently_updated = [item_id for item_id, in self.db.execute(
+            "SELECT asset_id FROM items ORDER BY updated_seq DESC, relevance_rank IS NULL, relevance_rank")]
+        return items, {RECENTLY_UPDATED_SORT: recently_updated}
+
+    def stats(self) -> Dict:
+        return {"items": self.count(), "full_crawl": self.state('full_crawl'), "refresh": self.state('refresh')}
+
+
+class CatalogCrawler:
+    # Keeps a CatalogStore up to date in the background. list_items(sort) yields every
+    # item of the catalog listing in that sort order and raises if a page fails, so a
+    # failed crawl never stores a partial listing. When a full crawl is due (or the
+    # store is empty) the whole relevance listing is stored; otherwise the "Recently
+    # Updated" listing is walked until it reaches a run of items already indexed as is.
+    # on_update is awaited whenever a crawl changed the store. Store work runs through
+    # CatalogStore.call, off the event loop.
+
+    def __init__(self, store: CatalogStore, list_items: Callable[[int], AsyncIterator[CatalogItem]],
+                 on_update: Callable[[], Awaitable[None]] = None, refresh_interval: float = CATALOG_REFRESH_INTERVAL,
+                 full_crawl_interval: float = CATALOG_FULL_CRAWL_INTERVAL, known_run: int = CATALOG_KNOWN_RUN):
+        self.store = store
+        self.list_items = list_items
+        self.on_update = on_update
+        self.refresh_interval = refresh_interval
+        self.full_crawl_interval = full_crawl_interval
+        self.known_run = known_run
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        while True:
+            try:
+                await self.crawl()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Catalog crawl failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def full_crawl_due(self) -> bool:
+        last_crawl = self.store.state('full_crawl')
+        return last_crawl is None or self.store.clock() - last_crawl >= self.full_crawl_interval
+
+    async def crawl(self):
+        if await self.store.call(self.full_crawl_due):
+            await self.full_crawl()
+        else:
+            await self.refresh()
+
+    async def full_crawl(self) -> int:
+        start = time.perf_counter()
+        items = self.list_items(RELEVANCE_SORT)
+        try:
+            listing = [item async for item in items]
+        finally:
+            await items.aclose()
+
+        count = await self.store.call(self.store.replace_listing, listing)
+        await self.updated()
+        logger.info(f"Indexed {count} catalog items in {time.perf_counter() - start:.1f}s")
+        return count
+
+    async def updated(self):
+        if self.on_update is not None:
+            await self.on_update()
+
+    async def refresh(self) -> int:
+        # Returns the number of new or changed items stored
+        updated = []
+        known = 0
+        items = self.list_items(RECENTLY_UPDATED_SORT)
+        try:
+            async for item in items:
+                if item.asset_id is None:
+                    continue
+                if await self.store.call(self.store.is_known, item):
+                    known += 1
+                    if known >= self.known_run:
+                        break
+                else:
+                    known = 0
+                    updated.append(item)
+        finally:
+            await items.aclose()
+
+        await self.store.call(self.store.record_updates, updated)
+        if updated:
+            logger.info(f"Updated {len(updated)} catalog items in the index")
+            await self.updated()
+        return len(updated)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the local catalog index from a saved catalog scrape")
+    parser.add_argument('dump', help="JSON list of scraped items in relevance order, e.g. item_data.json")
+    parser.add_argument('--db', default=CATALOG_INDEX_PATH or 'catalog.sqlite3')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.dump, encoding='utf-8') as json_file:
+        items = json.load(json_file)
+
+    store = CatalogStore(args.db)
+    try:
+        items = [CatalogItem.from_legacy(item) for item in items]
+        logger.info(f"Indexed {store.replace_listing(items)} items into {args.db}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
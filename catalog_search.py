@@ -0,0 +1,145 @@
+import heapq
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from catalog_index import RELEVANCE_SORT
+from records import CatalogItem
+
+# Number of query tokens whose matching items are kept between searches
+TOKEN_CACHE_SIZE = 4096
+# Matches are paged by walking the sort order while that takes at most this many
+# steps per match; otherwise the matches are sorted directly
+WALK_STEPS_PER_MATCH = 2
+
+# Sorts (main.SORT_DICT) derived from the items themselves besides relevance; others need an explicit order
+PRICE_LOW_TO_HIGH = 1
+PRICE_HIGH_TO_LOW = 2
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r'\w+', text.lower())
+
+
+class SearchResult(NamedTuple):
+    total: int
+    items: List[CatalogItem]
+
+
+class CatalogSearch:
+    # In-memory search over a catalog snapshot (CatalogItem records, in relevance order). Items are referred to by their position in the snapshot:
+    # names are indexed token -> positions, every item type filter and category is
+    # a precomputed set of positions, and every sort order is a precomputed array of
+    # positions with its inverse (position -> rank). Each filter set is also kept in
+    # every sort order, so a single filter pages by slicing; anything else is a few
+    # set intersections plus either a walk down the order array or a partial sort.
+    #
+    # q matches items whose name has, for every word of q, a word starting with it.
+    # orders supplies sorts that can't be derived from the items (recently updated,
+    # best selling) as lists of asset ids, and categories the asset ids in each
+    # category; items missing from an order come after the listed ones.
+
+    def __init__(self, items: List[CatalogItem], orders: Dict[int, Iterable[int]] = None,
+                 categories: Dict[int, Iterable[int]] = None):
+        self.items = items
+        positions = {item.asset_id: position for position, item in enumerate(items)}
+        positions.pop(None, None)
+
+        postings: Dict[str, set] = {}
+        for position, item in enumerate(items):
+            for token in set(tokenize(item.name)):
+                postings.setdefault(token, set()).add(position)
+        self.postings = {token: frozenset(matches) for token, matches in postings.items()}
+        self.vocabulary = sorted(self.postings)
+        self.token_matches = lru_cache(maxsize=TOKEN_CACHE_SIZE)(self.find_token_matches)
+
+        self.item_types: Dict[str, FrozenSet[int]] = {
+            'limited': frozenset(p for p, item in enumerate(items) if item.limited == 'limited'),
+            'limited_u': frozenset(p for p, item in enumerate(items) if item.limited == 'limited u'),
+            'free': frozenset(p for p, item in enumerate(items) if item.free),
+        }
+        self.categories = {category: frozenset(positions[item_id] for item_id in asset_ids if item_id in positions)
+                           for category, asset_ids in (categories or {}).items()}
+
+        # Price arrays: Robux priced items (Free counts as 0) by Robux, then Tickets-only items by Tickets
+        robux = [0 if item.free else item.robux for item in items]
+        tickets = [item.tickets for item in items]
+        self.by_robux = sorted((p for p in range(len(items)) if robux[p] is not None), key=robux.__getitem__)
+        self.by_tickets = sorted((p for p in range(len(items)) if robux[p] is None and tickets[p] is not None),
+                                 key=tickets.__getitem__)
+        unpriced = [p for p in range(len(items)) if robux[p] is None and tickets[p] is None]
+
+        self.orders: Dict[int, List[int]] = {
+            RELEVANCE_SORT: list(range(len(items))),
+            PRICE_LOW_TO_HIGH: self.by_robux + self.by_tickets + unpriced,
+            PRICE_HIGH_TO_LOW: self.descending(self.by_robux, robux) + self.descending(self.by_tickets, tickets) + unpriced,
+        }
+        for sort, asset_ids in (orders or {}).items():
+            listed = list(dict.fromkeys(positions[item_id] for item_id in asset_ids if item_id in positions))
+            seen = set(listed)
+            self.orders[sort] = listed + [p for p in range(len(items)) if p not in seen]
+
+        self.ranks: Dict[int, List[int]] = {}
+        for sort, order in self.orders.items():
+            rank = [0] * len(items)
+            for position_rank, position in enumerate(order):
+                rank[position] = position_rank
+            self.ranks[sort] = rank
+
+        # Filter sets in sort order, keyed by (filter set id, sort)
+        self.filter_orders: Dict[tuple, List[int]] = {}
+        for members in [*self.item_types.values(), *self.categories.values()]:
+            for sort, order in self.orders.items():
+                self.filter_orders[id(members), sort] = [p for p in order if p in members]
+
+    @staticmethod
+    def descending(order: List[int], key: List[int]) -> List[int]:
+        # order reversed by key, keeping snapshot order between equal prices
+        return sorted(order, key=lambda p: -key[p])
+
+    def find_token_matches(self, prefix: str) -> FrozenSet[int]:
+        # Positions of items with a name word starting with prefix
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + '\U0010ffff', start)
+        if end - start == 1:
+            return self.postings[self.vocabulary[start]]
+        return frozenset().union(*(self.postings[token] for token in self.vocabulary[start:end]))
+
+    def can_answer(self, category: int, sort: int) -> bool:
+        return (category == 0 or category in self.categories) and sort in self.orders
+
+    def search(self, q: Optional[str] = None, category: int = 0, sort: int = RELEVANCE_SORT, item_type: str = 'all',
+               offset: int = 0, limit: int = 10) -> SearchResult:
+        # Raises KeyError if can_answer(category, sort) is False
+        words = list(dict.fromkeys(tokenize(q or '')))
+        filters = ([self.categories[category]] if category else []) + \
+                  ([self.item_types[item_type]] if item_type in self.item_types else [])
+        end = offset + limit
+
+        if not words and len(filters) <= 1:
+            # The whole order or a single filter: already sorted, so the page is a slice
+            order = self.filter_orders[id(filters[0]), sort] if filters else self.orders[sort]
+            return SearchResult(len(order), [self.items[p] for p in order[offset:end]])
+
+        sets = sorted([self.token_matches(word) for word in words] + filters, key=len)
+        matches = sets[0].intersection(*sets[1:])
+        order = self.orders[sort]
+        total = len(matches)
+
+        if offset >= total:
+            page = []
+        elif end * len(order) <= WALK_STEPS_PER_MATCH * total * total:
+            # Matches are dense enough that walking the order array reaches the page
+            # in about end * len(order) / total steps
+            page = list(islice((p for p in order if p in matches), offset, end))
+        elif end >= total:
+            page = sorted(matches, key=self.ranks[sort].__getitem__)[offset:]
+        else:
+            page = heapq.nsmallest(end, matches, key=self.ranks[sort].__getitem__)[offset:]
+        return SearchResult(total, [self.items[p] for p in page])
+
+    def stats(self) -> Dict[str, int]:
+        return {"items": len(self.items), "tokens": len(self.vocabulary), "sorts": len(self.orders),
+                "categories": len(self.categories)}
@@ -0,0 +1,76 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+from typing import Dict, NamedTuple
+
+# Bumped whenever the encoded layout changes, so older cursors are refused instead of misread
+CURSOR_VERSION = 2
+CURSOR_SOURCES = ('live', 'index')
+# Key cursors are signed with. Set it to keep cursors valid across restarts and between
+# instances; without it a random key is made, so cursors only work on the process that issued them.
+CURSOR_SECRET = os.environ.get('CURSOR_SECRET', '').encode() or os.urandom(32)
+# Bytes of the HMAC-SHA256 kept in a cursor
+CURSOR_SIGNATURE_SIZE = 16
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Cursor(NamedTuple):
+    # Where a paginated call stopped: the endpoint and query it paginates, and the
+    # upstream listing page and card within it (live) or the result offset (index)
+    # the next call starts from
+    endpoint: str
+    params: Dict
+    page: int = 1
+    offset: int = 0
+    source: str = 'live'
+
+
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def signature(payload: str) -> bytes:
+    return hmac.new(CURSOR_SECRET, payload.encode('ascii'), hashlib.sha256).digest()[:CURSOR_SIGNATURE_SIZE]
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    data = [CURSOR_VERSION, cursor.endpoint, cursor.source, cursor.params, cursor.page, cursor.offset]
+    payload = b64encode(json.dumps(data, separators=(',', ':')).encode())
+    return f"{payload}.{b64encode(signature(payload))}"
+
+
+def decode_cursor(token: str, endpoint: str) -> Cursor:
+    # Raises InvalidCursor if token isn't a cursor this version made for endpoint, or
+    # was changed after it was issued. The query parameters it carries are not checked here.
+    payload, _, mac = token.partition('.')
+    try:
+        signed = hmac.compare_digest(b64decode(mac), signature(payload))
+    except (binascii.Error, UnicodeError, ValueError):
+        signed = False
+    if not signed:
+        raise InvalidCursor("Cursor was not issued by this API or has been modified")
+
+    try:
+        data = json.loads(b64decode(payload))
+        version, cursor_endpoint, source, params, page, offset = data
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+
+    if version != CURSOR_VERSION:
+        raise InvalidCursor("Cursor from an older version of the API; start over without it")
+    if cursor_endpoint != endpoint:
+        raise InvalidCursor(f"Cursor was not issued by /{endpoint}")
+    if (source not in CURSOR_SOURCES or not isinstance(params, dict) or type(page) is not int
+            or type(offset) is not int or page < 1 or offset < 0):
+        raise InvalidCursor("Malformed cursor")
+    return Cursor(endpoint, params, page, offset, source)
@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+from collections import Counter
+from html import escape
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+from upstream import UpstreamResponse
+
+logger = logging.getLogger(__name__)
+
+# Saved scrape outputs the fixture pages are rebuilt from
+ITEM_DATA_FILE = 'item_data.json'
+GAME_INFO_FILE = 'game_info.json'
+
+SITE_URL = "https://www.syntax.eco"
+
+# Number of item cards on a catalog listing page and game cards on a games listing page
+CATALOG_PAGE_SIZE = 36
+GAMES_PAGE_SIZE = 24
+# Number of games on the fixture games listing and the id of the first one
+FIXTURE_GAMES = 240
+FIRST_GAME_ID = 10174
+
+
+def load_items(filename: str = ITEM_DATA_FILE) -> List[Dict]:
+    with open(filename, encoding='utf-8') as json_file:
+        return json.load(json_file)
+
+
+def load_game(filename: str = GAME_INFO_FILE) -> Dict:
+    with open(filename, encoding='utf-8') as json_file:
+        return json.load(json_file)
+
+
+def relative(url: str) -> str:
+    return url[len(SITE_URL):] if url and url.startswith(SITE_URL) else url
+
+
+def page_shell(title: str, body: str) -> str:
+    return (
+        '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+        f'<title>{escape(title)} - SYNTAX</title>\n'
+        '<link rel="stylesheet" href="/static/bootstrap.min.css">\n'
+        '<script src="/static/bootstrap.bundle.min.js"></script>\n'
+        '</head>\n<body class="bg-dark">\n'
+        '<nav class="navbar navbar-expand-lg"><div class="container">'
+        '<a class="navbar-brand" href="/">SYNTAX</a>'
+        '<a class="nav-link" href="/games">Games</a><a class="nav-link" href="/catalog">Catalog</a>'
+        '</div></nav>\n'
+        f'<div class="container mt-3">\n{body}\n</div>\n'
+        '<footer class="text-secondary"><p class="m-2">SYNTAX is not affiliated with Roblox Corporation.</p></footer>\n'
+        '</body>\n</html>\n'
+    )
+
+
+def render_price_change(label: str, value) -> str:
+    return (f'<span class="text-secondary fw-normal">{label}</span> '
+            f'{value if value not in (None, "Free") else "Free"}')
+
+
+def render_item_card(item: Dict) -> str:
+    # Inverse of parsing.process_item: renders the markup the item dict was scraped from
+    price = item['item_price']
+    limited_type = item['limited_info']['type']
+
+    parts = [f'<img class="card-img-top" src="{escape(relative(item["item_image"]))}" alt="">']
+    if limited_type != 'None':
+        limited_u = '<span class="text-limitedu">U</span>' if limited_type == 'limited u' else ''
+        parts.append(f'<p class="position-absolute m-0 fw-bold text-limited">LIMITED{limited_u}</p>')
+    parts.append(f'<p class="text-secondary">{escape(item["item_name"])}</p>')
+
+    if price == 'Free':
+        parts.append('<p class="text-robux">Free</p>')
+    else:
+        if price['Robux'] != 'None':
+            parts.append(f'<p class="text-robux">R$ {price["Robux"]}</p>')
+        if price['Tickets'] != 'None':
+            parts.append(f'<p class="text-tickets">T$ {price["Tickets"]}</p>')
+        if price['price_change'] != 'None':
+            parts.append('<p class="m-0">'
+                         f'{render_price_change("was", price["price_change"]["was"])} '
+                         f'{render_price_change("now", price["price_change"]["now"])}</p>')
+
+    return (f'<a href="{escape(relative(item["item_link"]))}" class="text-decoration-none">'
+            f'<div class="item-card card bg-dark m-1">{"".join(parts)}</div></a>')
+
+
+def render_catalog_page(items: List[Dict], page_number: int, total_pages: int) -> str:
+    cards = '\n'.join(render_item_card(item) for item in items)
+    body = (
+        '<div class="d-flex align-items-center">'
+        f'<p class="ms-2 me-2 text-white">Page {page_number} of {total_pages}</p></div>\n'
+        f'<div class="row">\n{cards}\n</div>'
+    )
+    return page_shell('Catalog', body)
+
+
+def game_variant(game: Dict, game_id: int) -> Dict:
+    # Distinct copy of the saved game so every fixture game has its own title and thumbnail
+    variant = dict(game)
+    variant['Game Title'] = f"{game['Game Title']} #{game_id}"
+    variant['Thumbnail Source'] = f"/Thumbs/Asset.ashx?assetId={game_id}&x=1280&y=720"
+    return variant
+
+
+def game_path(game: Dict, game_id: int) -> str:
+    return f"/games/{game_id}/{'-'.join(game['Game Title'].split()[:2])}"
+
+
+def render_game_card(game: Dict, game_id: int) -> str:
+    return (f'<a href="{escape(game_path(game, game_id))}" '
+            'class="text-decoration-none p-1 col-xxl-2 col-lg-3 col-md-4 col-sm-6">'
+            f'<div class="card"><img src="{escape(game["Thumbnail Source"])}" alt="">'
+            f'<p class="text-white text-truncate">{escape(game["Game Title"])}</p></div></a>')
+
+
+def render_games_page(games: List[Dict], game_ids: List[int], page_number: int, total_pages: int) -> str:
+    cards = '\n'.join(render_game_card(game, game_id) for game, game_id in zip(games, game_ids))
+    body = (
+        '<div class="d-flex align-items-center">'
+        f'<p class="m-0 ms-2 me-2 text-white">Page {page_number} of {total_pages}</p></div>\n'
+        f'<div class="row">\n{cards}\n</div>'
+    )
+    return page_shell('Games', body)
+
+
+def render_game_page(game: Dict) -> str:
+    # Inverse of parsing.process_game_details
+    builder_club = ('<p class="text-warning">A Builders Club membership is required to join this game</p>'
+                    if game['Builder Club Required'] == 'Yes' else '')
+    stats = ''.join(
+        f'<div class="col text-center"><p class="text-secondary m-0">{label}</p><h2>{escape(str(game[key]))}</h2></div>'
+        for label, key in (('Playing', 'Active Players'), ('Visits', 'Visits Count'), ('Created', 'Created Date'),
+                           ('Updated', 'Updated Date'), ('Max Players', 'Server Size'))
+    )
+    passes = ''.join(
+        '<div class="p-1"><div class="card">'
+        f'<img src="{escape(game_pass["image"])}" alt=""><h5>{escape(game_pass["name"])}</h5>'
+        f'<p class="text-robux">R$ {game_pass["price"]}</p></div></div>'
+        for game_pass in game['Game Passes']
+    )
+    body = (
+        '<div class="row">'
+        f'<div class="col-8"><img class="rounded w-100" src="{escape(game["Thumbnail Source"])}" alt=""></div>'
+        '<div class="col-4">'
+        f'<h1 class="m-0">{escape(game["Game Title"])}</h1>'
+        f'<p class="m-0">By <a href="/users/1/profile">{escape(game["Creator Name"])}</a></p>'
+        f'{builder_club}'
+        '<div class="d-flex">'
+        f'<div class="icon-favorite"></div><span class="text-favorite">{game["Favorites Count"]}</span>'
+        f'<div class="upvote"></div><span class="vote-up-text">{game["Likes Count"]}</span>'
+        f'<div class="downvote"></div><span class="vote-down-text">{game["Dislikes Count"]}</span>'
+        '</div></div></div>\n'
+        '<nav><div class="nav nav-tabs"><button class="nav-link active">About</button>'
+        '<button class="nav-link">Store</button></div></nav>\n'
+        '<div class="tab-content">'
+        '<div class="tab-pane show active" id="nav-about">'
+        f'<div class="ms-2">{escape(game["Description"])}</div>'
+        f'<div class="row mt-3">{stats}</div></div>'
+        f'<div class="tab-pane" id="nav-store"><div class="d-flex flex-wrap">{passes}</div></div>'
+        '</div>'
+    )
+    return page_shell(game['Game Title'], body)
+
+
+def catalog_pages(items: List[Dict], page_size: int = CATALOG_PAGE_SIZE) -> List[str]:
+    total_pages = max(1, -(-len(items) // page_size))
+    return [render_catalog_page(items[start:start + page_size], page_index + 1, total_pages)
+            for page_index, start in enumerate(range(0, max(len(items), 1), page_size))]
+
+
+class FixturePages:
+    # Serves fixture pages by upstream URL, rendering each page once
+
+    def __init__(self, items: List[Dict] = None, game: Dict = None, total_games: int = FIXTURE_GAMES):
+        self.items = load_items() if items is None else items
+        self.game = load_game() if game is None else game
+        self.total_games = total_games
+        self.catalog_total_pages = max(1, -(-len(self.items) // CATALOG_PAGE_SIZE))
+        self.games_total_pages = max(1, -(-total_games // GAMES_PAGE_SIZE))
+        self.rendered: Dict[str, Optional[str]] = {}
+
+    def render(self, url: str) -> Optional[str]:
+        # Returns the page for url, or None if the fixture site has no such page
+        parts = urlsplit(url)
+        # Listing URLs built as "{url}?page=n" may carry the page after a second "?"
+        page_match = re.search(r'[?&]page=(\d+)', url)
+        page_number = int(page_match.group(1)) if page_match else 1
+        game_match = re.match(r'/games/(\d+)(/|$)', parts.path)
+
+        if parts.path.rstrip('/') == '/catalog':
+            key = f'catalog:{page_number}'
+        elif parts.path.rstrip('/') == '/games/popular/view':
+            key = f'games:{page_number}'
+        elif game_match:
+            key = f'game:{int(game_match.group(1))}'
+        else:
+            return None
+
+        if key not in self.rendered:
+            self.rendered[key] = self.render_key(key)
+        return self.rendered[key]
+
+    def render_key(self, key: str) -> Optional[str]:
+        kind, number = key.split(':')
+        number = int(number)
+
+        if kind == 'catalog':
+            page_number = min(number, self.catalog_total_pages)
+            start = (page_number - 1) * CATALOG_PAGE_SIZE
+            return render_catalog_page(self.items[start:start + CATALOG_PAGE_SIZE] if number == page_number else [],
+                                       page_number, self.catalog_total_pages)
+
+        if kind == 'games':
+            start = (number - 1) * GAMES_PAGE_SIZE
+            game_ids = [FIRST_GAME_ID + index for index in range(start, min(start + GAMES_PAGE_SIZE, self.total_games))]
+            games = [game_variant(self.game, game_id) for game_id in game_ids]
+            return render_games_page(games, game_ids, number, self.games_total_pages)
+
+        if FIRST_GAME_ID <= number < FIRST_GAME_ID + self.total_games:
+            return render_game_page(game_variant(self.game, number))
+        return None
+
+
+class FixtureUpstream:
+    # In-memory stand-in for upstream.BoundUpstream that answers from FixturePages
+    # after an optional simulated round trip, counting requests per page kind
+
+    def __init__(self, pages: FixturePages = None, latency: float = 0.0):
+        self.pages = pages or FixturePages()
+        self.latency = latency
+        self.requests = Counter()
+        self.urls = Counter()
+
+    def bind(self, headers: Dict[str, str]) -> 'FixtureUpstream':
+        # Stands in for the app's UpstreamClient as well
+        return self
+
+    async def get(self, url: str, headers: Dict[str, str] = None) -> UpstreamResponse:
+        # Pages never change, so there are no validators and every request gets the full page
+        page = self.pages.render(url)
+        self.requests[page_kind(url)] += 1
+        self.urls[url] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return UpstreamResponse(200, page) if page is not None else UpstreamResponse(404, 'Not Found')
+
+
+def page_kind(url: str) -> str:
+    path = urlsplit(url).path.rstrip('/')
+    if path == '/catalog':
+        return 'catalog listing'
+    if path == '/games/popular/view':
+        return 'games listing'
+    if re.match(r'/games/\d+', path):
+        return 'game detail'
+    return 'other'
+
+
+def stand_in_app(pages: FixturePages = None, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, seed: Optional[int] = None) -> web.Application:
+    # Local aiohttp stand-in for syntax.eco serving the fixture pages. Every response is
+    # delayed by latency plus up to jitter seconds, and error_rate of them fail with error_status.
+    pages = pages or FixturePages()
+    rng = random.Random(seed)
+    requests = Counter()
+
+    async def handle(request: web.Request) -> web.Response:
+        requests[page_kind(str(request.url))] += 1
+        delay = latency + (rng.uniform(0, jitter) if jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if error_rate and rng.random() < error_rate:
+            return web.Response(status=error_status, text='Injected error')
+
+        page = pages.render(str(request.url))
+        if page is None:
+            return web.Response(status=404, text='Not Found')
+        # Pages carry an ETag, answer matching conditional requests with 304 and are compressed when asked
+        etag = f'"{hashlib.md5(page.encode()).hexdigest()}"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        response = web.Response(text=page, content_type='text/html', headers={'ETag': etag})
+        response.enable_compression()
+        return response
+
+    app = web.Application()
+    app['requests'] = requests
+    app.router.add_get('/{tail:.*}', handle)
+    return app
+
+
+async def start_stand_in(app: web.Application, host: str = '127.0.0.1', port: int = 0) -> web.AppRunner:
+    # Starts the stand-in; runner.addresses holds the address it listens on
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def stand_in_url(runner: web.AppRunner) -> str:
+    host, port = runner.addresses[0][:2]
+    return f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the fixture pages as a local stand-in for syntax.eco "
+                                                 "(point the API at it with SYNTAX_UPSTREAM_URL)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many extra seconds per response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of responses that fail")
+    parser.add_argument('--error-status', type=int, default=503)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = stand_in_app(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                       error_status=args.error_status)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,101 @@
 from enum import Enum
+import asyncio
+import json
 import logging
-from contextlib import contextmanager
-
-from aiohttp import ClientSession
-from fastapi import FastAPI, Query, Header, HTTPException
-from bs4 import BeautifulSoup
-import requests
-import random
+import os
 import re
-from urllib.parse import urljoin, urlencode
-from typing import Optional, List, Dict
-
-HTML_PARSER = 'html5lib'
-INDENTATION = 2
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 
-from starlette.responses import RedirectResponse
-
-app = FastAPI()
+from fastapi import Body, FastAPI, Query, Header, HTTPException, Request
+import random
+from urllib.parse import urljoin, urlencode, urlsplit
+from typing import AsyncIterator, Callable, Optional, List, Dict, Tuple
+
+# Site the pages are scraped from (overridable to point the API at a local stand-in)
+UPSTREAM_URL = os.environ.get('SYNTAX_UPSTREAM_URL', 'https://www.syntax.eco').rstrip('/')
+
+# Maximum number of catalog pages fetched concurrently for a single request
+CATALOG_MAX_INFLIGHT_PAGES = 4
+# Maximum number of games listing pages fetched ahead of the detail fetches
+GAMES_MAX_INFLIGHT_PAGES = 2
+# Maximum number of game ids a single /games/batch request may ask for
+GAME_BATCH_MAX_IDS = 100
+# Maximum number of catalog pages fetched concurrently by the catalog index crawler
+CATALOG_CRAWL_MAX_INFLIGHT_PAGES = 2
+
+from starlette.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+
+import metrics
+import parsing
+from parsing import ParsePool, parse, parse_catalog_listing, parse_game_page, parse_games_listing
+from cache import ResponseCache
+from page_store import PageStore
+from catalog_index import CATALOG_INDEX_PATH, CatalogCrawler, CatalogStore
+from catalog_search import CatalogSearch
+from cursors import Cursor, InvalidCursor, decode_cursor, encode_cursor
+from price_history import MAX_HISTORY_BUCKETS, PRICE_HISTORY_PATH, PriceHistory
+from records import CatalogItem, GameDetails
+from upstream import BoundUpstream, UpstreamClient, UpstreamError
+
+# Parsed upstream pages shared by every request
+page_cache = ResponseCache()
+# Raw upstream pages and their validators, so reloading an expired page is a conditional GET
+page_store = PageStore()
+# Local catalog index (set up at startup when CATALOG_INDEX_PATH is set) and the
+# in-memory search over its latest snapshot that /catalog answers from
+catalog_store: Optional[CatalogStore] = None
+catalog_search: Optional[CatalogSearch] = None
+
+# Prices of every catalog item scraped, for /catalog/{asset_id}/history
+price_history = PriceHistory()
+
+def build_catalog_search(store: CatalogStore) -> Optional[CatalogSearch]:
+    return CatalogSearch(*store.snapshot()) if store.count() else None
+
+async def load_catalog_search():
+    # Rebuild the search over the current contents of the catalog index on the
+    # store's thread; requests keep using the previous one until it is swapped in
+    global catalog_search
+    catalog_search = await catalog_store.call(build_catalog_search, catalog_store)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled upstream client for the lifetime of the app
+    app.state.upstream = UpstreamClient()
+    await app.state.upstream.start()
+    # Page parsing runs in a worker pool, off the event loop
+    parsing.parse_pool = ParsePool()
+    parsing.parse_pool.start()
+    if PRICE_HISTORY_PATH:
+        price_history.open(PRICE_HISTORY_PATH)
+    # Keep the local catalog index up to date in the background
+    global catalog_store, catalog_search
+    crawler = None
+    if CATALOG_INDEX_PATH:
+        catalog_store = CatalogStore(CATALOG_INDEX_PATH)
+        await load_catalog_search()
+        upstream = app.state.upstream.bind(build_headers(DEFAULT_SESSION_COOKIE, DEFAULT_SECURITY_COOKIE, None))
+        crawler = CatalogCrawler(catalog_store, lambda sort: crawl_catalog_listing(upstream, sort),
+                                 on_update=load_catalog_search)
+        crawler.start()
+    try:
+        yield
+    finally:
+        if crawler is not None:
+            await crawler.close()
+            catalog_store.close()
+            catalog_store = catalog_search = None
+        await page_cache.close()
+        price_history.close()
+        parsing.parse_pool.close()
+        parsing.parse_pool = ParsePool('inline')
+        await app.state.upstream.close()
+
+app = FastAPI(lifespan=lifespan)
+# Pages fetched and time spent per request, for /metrics (and Server-Timing when SERVER_TIMING is set)
+app.add_middleware(metrics.MetricsMiddleware)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,6 +106,10 @@ USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
 ]
 
+# Cookies sent when the caller doesn't supply its own (and by the catalog index crawler)
+DEFAULT_SESSION_COOKIE = 'eyJjc3JmX3Rva2VuIjoiYmE0NDQ3MDUzM2FhNzFjOTZiMjQ3NjRlYmM4ZDJjNzAwMDU4NTY5MCJ9.ZW_8EA.Pw1spJO8Mss-8D7r18A71-a72to'
+DEFAULT_SECURITY_COOKIE = 'sAnHbclLJht1JilJR17QvWo9uHc2sqdLy61dB5RWKlZhAHlJ6SAT3epf3I5V992QzeX07K1y3wqAKIkb0N9L8SzHDez6wj2SqqKGw8DZCOXOn0y6Yhu9xIsiLV0b665GD5dUXqQq0T4EFXmsRy4fFkcASElaVGFpDsrK2zJ9vGuqkYWSIVWM0NWaW3eEdavemkqaikR9oltRKLGUu2y0Ub8iPuVqdsCs3nerpLbA9XCN5ZbaALJ4TbRfUDUNjl1sdK3SfsYup7LyysQTQqQmWYLikYHvHaGkhtFDREApkKQMKvRqIstt2PnsXH4uYFJtVkxbIAonRpyFcqoaAz6kYBuHovDMES61rq8WW65LFUJFgndcpiWb0liCw7N5KziQuA5m3OerXrrp3ELB0cxQnmr1GjqVlxRb7OvC9YlRJ4kjWqnSFxEMIyPXjoxfGcPeGevC3cKMhJprDH8KkF6hu1BZDldllTKfIEgq5tn55dZFcxEK2xfChJSDnkJwR4Tz'
+
 CATEGORY_DICT = {
     1: "Featured Hats",
     2: "Featured Gears",
@@ -54,100 +137,11 @@ SORT_DICT = {
     4: "Best Selling"
 }
 
-@contextmanager
-def create_session(session_cookie, sec_cookie, user_agents):
-    headers = {'User-Agent': random.choice(user_agents),
-               'Cookie': f'session={session_cookie}; .ROBLOSECURITY={sec_cookie}'}
-    session = requests.Session()
-    session.headers.update(headers)
-
-    retry_strategy = requests.packages.urllib3.Retry(
-        total=3,
-        status_forcelist=[500, 502, 503, 504],
-        backoff_factor=1,
-    )
-    adapter = requests.adapters.HTTPAdapter(max_retries=retry_strategy)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-
-    yield session
-
-    session.close()
-
-def extract_total_pages(text):
-    match = re.search(r'Page \d+ of (\d+)', text)
-    return int(match.group(1)) if match else 1
-
-def process_item(item):
-    try:
-        item_name = item.find('p', class_='text-secondary').text.strip()
-        item_price_robux = item.find('p', class_='text-robux')
-        item_price_tickets = item.find('p', class_='text-tickets')
-
-        robux_price = int(re.search(r'\d+', item_price_robux.text).group()) if item_price_robux and re.search(
-            r'\d+', item_price_robux.text) else None
-        tickets_price = int(
-            re.search(r'\d+', item_price_tickets.text).group()) if item_price_tickets and re.search(r'\d+',
-                                                                                                    item_price_tickets.text) else None
-
-        price_change_tag = item.find('span', class_='text-secondary fw-normal', string='now')
-        price_change_now = int(
-            re.search(r'\d+', price_change_tag.next_sibling).group()) if price_change_tag and re.search(r'\d+',
-                                                                                                        price_change_tag.next_sibling) else None
-        price_change_was_tag = item.find('span', class_='text-secondary fw-normal', string='was')
-        price_change_was = int(
-            re.search(r'\d+', price_change_was_tag.next_sibling).group()) if price_change_was_tag and re.search(
-            r'\d+', price_change_was_tag.next_sibling) else None
-
-        price_change = {
-            "was": price_change_was,
-            "now": price_change_now
-        }
-
-        if all(value is None for value in price_change.values()):
-            price_change = "None"
-        else:
-            if price_change["was"] is None:
-                price_change["was"] = "Free"
-            if price_change["now"] is None:
-                price_change["now"] = "Free"
-
-        if robux_price is None and tickets_price is None:
-            item_price_value = "Free"
-        else:
-            item_price_value = {
-                "Robux": str(robux_price) if robux_price is not None else "None",
-                "Tickets": str(tickets_price) if tickets_price is not None else "None",
-                "price_change": price_change
-            }
-
-        limited_tag = item.find('p', class_='position-absolute m-0 fw-bold text-limited')
-        limited_u_tag = limited_tag.find('span', class_='text-limitedu') if limited_tag else None
-
-        limited_info = {
-            "type": "limited u" if limited_u_tag else ("limited" if limited_tag else "None"),
-        }
-
-        item_link_tag = item.find_parent('a', href=True)
-        item_link_relative = item_link_tag['href'].strip() if item_link_tag else None
-        item_link = f"https://www.syntax.eco{item_link_relative}" if item_link_relative else None
-
-        img_src = item.find('img')['src'].strip()
-        item_image = f"https://www.syntax.eco{img_src}" if img_src else None
-
-        item_data = {
-            "item_name": item_name,
-            "item_price": item_price_value,
-            "limited_info": limited_info,
-            "item_link": item_link,
-            "item_image": item_image,
-        }
-
-        return item_data
-
-    except Exception as e:
-        logger.error(f"Error processing an item: {e}")
-        return None
+def build_headers(session_cookie: str, security_cookie: str, user_agent: Optional[str]) -> Dict[str, str]:
+    return {
+        'User-Agent': user_agent or random.choice(USER_AGENTS),
+        'Cookie': f'.ROBLOSECURITY={security_cookie}; session={session_cookie}'
+    }
 
 def process_category(category_num):
     return CATEGORY_DICT.get(category_num, "Unknown Category")
@@ -161,268 +155,723 @@ class ItemType(str, Enum):
     limited_u = "limited_u"
     free = "free"
 
-async def fetch_page(session: ClientSession, url: str) -> List[Dict]:
-    async with session.get(url) as response:
-        if response.status == 200:
-            soup = BeautifulSoup(await response.text(), 'html5lib')
-            items = soup.find_all(class_='item-card')
-            return items  
+class CatalogSource(str, Enum):
+    auto = "auto"
+    index = "index"
+    live = "live"
 
-        logger.error(f"Failed to fetch page {url}. Status Code: {response.status}")
-        return []
+class PriceField(str, Enum):
+    robux = "robux"
+    tickets = "tickets"
+    now = "now"
 
-async def get_catalog_page(session: ClientSession, search_url: str, limit: int, item_type: ItemType) -> List[Dict]:
-    data = []  # List to store item data
+class RecordShape(str, Enum):
+    legacy = "legacy"
+    compact = "compact"
 
-    # Asynchronously fetch the first page to extract total pages
-    async with session.get(search_url) as response:
-        if response.status == 200:
-            soup = BeautifulSoup(await response.text(), 'html.parser')
-            page_info = soup.find('p', class_='ms-2 me-2 text-white')
-            total_pages = extract_total_pages(page_info.text) if page_info else 1
-        else:
-            return data  # Return empty data if the first page fails to load
+class StreamFormat(str, Enum):
+    ndjson = "ndjson"
+    sse = "sse"
 
-    # Asynchronously fetch each page and process items
-    for page_number in range(1, total_pages + 1):
-        page_url = f"{search_url}&page={page_number}"
-        items = await fetch_page(session, page_url)
-
-        for item in items:
-            processed_item = process_item(item)  # Ensure process_item is suitable for your data structure
+STREAM_MEDIA_TYPES = {
+    StreamFormat.ndjson: "application/x-ndjson",
+    StreamFormat.sse: "text/event-stream",
+}
 
-            # Filter by item type
-            if processed_item and item_type_filter(processed_item, item_type):
-                data.append(processed_item)
+async def fetch_upstream(upstream: BoundUpstream, page: str, url: str, headers: Optional[Dict[str, str]] = None):
+    # Fetch one upstream page, timed under its page type for /metrics
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        response = await upstream.get(url, headers)
+        status = response.status
+        return response
+    finally:
+        metrics.record_fetch(page, status, time.perf_counter() - start)
+
+async def fetch_parsed(upstream: BoundUpstream, page: str, url: str, parser: Callable, on_load: Callable = None):
+    # Fetch url and parse it. The fetch is conditional on the copy in the page store,
+    # and a page that comes back unchanged (304, or the same content) is not parsed
+    # again: the earlier result is returned and on_load is not called. Raises
+    # UpstreamError if it fails.
+    stored = page_store.get(url)
+    headers = stored.validators() if stored is not None else None
+    response = await fetch_upstream(upstream, page, url, headers)
+
+    if response.status == 304 and stored is not None:
+        stored = page_store.not_modified(stored, response.etag, response.last_modified)
+    elif response.status == 200:
+        stored = page_store.put(url, response.text, response.etag, response.last_modified)
+    else:
+        raise UpstreamError(url, response.status)
+
+    if parser.__name__ in stored.parsed:
+        return stored.parsed[parser.__name__]
+    parsed = stored.parsed[parser.__name__] = await parse(parser, response.text or stored.text())
+    if on_load is not None:
+        on_load(parsed)
+    return parsed
+
+async def load_page(upstream: BoundUpstream, endpoint: str, url: str, parser: Callable,
+                    on_load: Callable = None):
+    # Fetch and parse one upstream page through the page cache. Raises UpstreamError
+    # if the page could not be fetched; failures are never cached. on_load is called
+    # with each freshly parsed page (not with pages served from the cache).
+    return await page_cache.get_or_load(endpoint, url, lambda: fetch_parsed(upstream, endpoint, url, parser, on_load),
+                                        variant=parser.__name__)
+
+def page_url(url: str, page_number: int) -> str:
+    return f"{url}{'&' if '?' in url else '?'}page={page_number}"
+
+def catalog_page_loaded(page: Tuple[int, List[Optional[CatalogItem]]]):
+    _, items = page
+    price_history.record(items)
+    metrics.DROPPED_RECORDS.inc('catalog_item', amount=items.count(None))
+
+async def load_catalog_page(upstream: BoundUpstream, url: str) -> Tuple[int, List[Optional[CatalogItem]]]:
+    # Items are parsed and processed in the parse pool; failed items come back as None.
+    # The prices of every freshly scraped page go into the price history.
+    return await load_page(upstream, 'catalog', url, parse_catalog_listing, on_load=catalog_page_loaded)
+
+async def crawl_catalog_page(upstream: BoundUpstream, url: str) -> Tuple[int, List[Optional[CatalogItem]]]:
+    # Catalog page for the index crawler. It skips the page cache: a stale hit would
+    # index the previous crawl's listing, and a full crawl would evict every page
+    # requests are served from. The page store still makes it a conditional GET.
+    return await fetch_parsed(upstream, 'catalog', url, parse_catalog_listing, on_load=catalog_page_loaded)
+
+async def crawl_catalog_items(upstream: BoundUpstream, url: str) -> List[Optional[CatalogItem]]:
+    _, items = await crawl_catalog_page(upstream, url)
+    return items
+
+async def fetch_page(upstream: BoundUpstream, url: str) -> List[Optional[CatalogItem]]:
+    try:
+        _, items = await load_catalog_page(upstream, url)
+        return items
+    except UpstreamError as e:
+        logger.error(f"Failed to fetch page {url}. Status Code: {e.status}")
+        return []
 
-                # Check if the limit is reached after each item is processed
-                if len(data) >= limit:
-                    return data[:limit]
+class PagePrefetcher:
+    # Async iterator over page_urls that keeps up to max_inflight page fetches
+    # running ahead of the consumer and yields their results in page order.
+    # Fetching starts as soon as it is created; aclose() cancels any fetches
+    # that are still outstanding. With prefetch_pages set, only that many pages
+    # are fetched ahead of being asked for; later ones are fetched on demand.
+
+    def __init__(self, upstream: BoundUpstream, page_urls: List[str], max_inflight: int, fetch: Callable = None,
+                 prefetch_pages: Optional[int] = None):
+        self.upstream = upstream
+        self.page_urls = iter(page_urls)
+        self.fetch = fetch or fetch_page
+        self.prefetch_pages = prefetch_pages
+        self.pending = deque()
+        for _ in range(max_inflight):
+            self.schedule_next(prefetch=True)
+
+    def schedule_next(self, prefetch: bool = False):
+        if prefetch and self.prefetch_pages is not None:
+            if self.prefetch_pages <= 0:
+                return
+            self.prefetch_pages -= 1
+
+        page_url = next(self.page_urls, None)
+        if page_url is not None:
+            self.pending.append(asyncio.ensure_future(self.fetch(self.upstream, page_url)))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.pending:
+            self.schedule_next()
+        if not self.pending:
+            raise StopAsyncIteration
+        items = await self.pending.popleft()
+        self.schedule_next(prefetch=True)
+        return items
+
+    async def aclose(self):
+        pending, self.pending = self.pending, deque()
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+class ListingPosition:
+    # Where a walk over a paginated listing stands: the upstream page and the card
+    # within it to continue from. total_pages is known once the first page is loaded.
+
+    __slots__ = ('page', 'offset', 'total_pages')
+
+    def __init__(self, page: int = 1, offset: int = 0):
+        self.page = page
+        self.offset = offset
+        self.total_pages: Optional[int] = None
+
+    def at(self, page: int, offset: int, page_size: int = 0):
+        # Continue from card offset of page; past the last card that is the next page
+        if offset >= page_size:
+            page, offset = page + 1, 0
+        self.page, self.offset = page, offset
+
+    @property
+    def exhausted(self) -> bool:
+        return self.total_pages is not None and self.page > self.total_pages
+
+async def walk_listing_pages(upstream: BoundUpstream, url: str, load: Callable, fetch: Callable,
+                             max_inflight: int, wanted: Optional[int] = None, position: ListingPosition = None):
+    # Yield the cards of every listing page of url in page order, from position.page
+    # on (page 1 by default). The first page is fetched once and supplies both the
+    # page count (every page carries it) and its own cards; the remaining pages start
+    # prefetching before it is handed to the consumer. If the consumer needs about
+    # `wanted` cards past position.offset, only the pages expected to hold them are
+    # prefetched. Raises UpstreamError if the first page can't be fetched.
+    position = position or ListingPosition()
+    start_page = position.page
+    total_pages, first_page = await load(upstream, page_url(url, start_page))
+    position.total_pages = total_pages
+
+    prefetch_pages = None
+    if wanted is not None:
+        remaining = wanted - max(0, len(first_page) - position.offset)
+        prefetch_pages = -(-remaining // len(first_page)) if remaining > 0 and first_page else 0
+
+    page_urls = [page_url(url, page_number) for page_number in range(start_page + 1, total_pages + 1)]
+    pages = PagePrefetcher(upstream, page_urls, max_inflight, fetch=fetch, prefetch_pages=prefetch_pages)
+    try:
+        yield first_page
+        async for page in pages:
+            yield page
+    finally:
+        await pages.aclose()
+
+async def iter_catalog_items(upstream: BoundUpstream, search_url: str, limit: int, item_type: ItemType,
+                             max_inflight: int = CATALOG_MAX_INFLIGHT_PAGES,
+                             position: ListingPosition = None) -> AsyncIterator[CatalogItem]:
+    # Yields up to limit matching items in catalog order as soon as their page is processed,
+    # starting at position (the first card by default) and keeping it just past the last item yielded.
+    # Raises UpstreamError if the first page fails to load
+    count = 0
+    position = position or ListingPosition()
+
+    # Fetch the pages concurrently (bounded by max_inflight) and process items in page order
+    # Without an item type filter every item counts towards the limit, so the pages needed are known
+    wanted = limit if item_type == ItemType.all else None
+    pages = walk_listing_pages(upstream, search_url, load_catalog_page, fetch_page, max_inflight, wanted=wanted,
+                               position=position)
+    try:
+        page_number, start = position.page, position.offset
+        async for items in pages:
+            for index in range(start, len(items)):
+                processed_item = items[index]
+                # Filter by item type
+                if processed_item and item_type_filter(processed_item, item_type):
+                    position.at(page_number, index + 1, len(items))
+                    yield processed_item
+                    count += 1
+
+                    # Stop once the limit is reached; closing the pages cancels outstanding fetches
+                    if count >= limit:
+                        return
+            page_number, start = page_number + 1, 0
+            position.at(page_number, 0)
+    finally:
+        await pages.aclose()
+
+async def get_catalog_page(upstream: BoundUpstream, search_url: str, limit: int, item_type: ItemType,
+                           max_inflight: int = CATALOG_MAX_INFLIGHT_PAGES,
+                           position: ListingPosition = None) -> List[CatalogItem]:
+    # Raises UpstreamError if the first page fails to load
+    items = iter_catalog_items(upstream, search_url, limit, item_type, max_inflight, position)
+    try:
+        return [item async for item in items]  # List to store item data
+    finally:
+        await items.aclose()
+
+async def crawl_catalog_listing(upstream: BoundUpstream, sort: int) -> AsyncIterator[CatalogItem]:
+    # Yields every item of the whole catalog in the given sort order for the catalog
+    # index. Unlike iter_catalog_items a page that fails to load raises UpstreamError
+    # instead of being skipped, so a partial listing is never taken for the catalog.
+    url = f"{UPSTREAM_URL}/catalog/?{urlencode({'category': 0, 'sort': sort})}"
+    pages = walk_listing_pages(upstream, url, crawl_catalog_page, crawl_catalog_items, CATALOG_CRAWL_MAX_INFLIGHT_PAGES)
+    try:
+        async for items in pages:
+            for processed_item in items:
+                if processed_item:
+                    yield processed_item
+    finally:
+        await pages.aclose()
 
-    return data
+async def iter_items(items: List[CatalogItem]) -> AsyncIterator[CatalogItem]:
+    for item in items:
+        yield item
 
 # It's a good practice to separate the filtering logic into its own function
-def item_type_filter(processed_item: Dict, item_type: ItemType) -> bool:
+def item_type_filter(processed_item: CatalogItem, item_type: ItemType) -> bool:
     return (
         item_type == ItemType.all or
-        (item_type == ItemType.limited and processed_item['limited_info']['type'] == 'limited') or
-        (item_type == ItemType.limited_u and processed_item['limited_info']['type'] == 'limited u') or
-        (item_type == ItemType.free and processed_item['item_price'] == 'Free')
+        (item_type == ItemType.limited and processed_item.limited == 'limited') or
+        (item_type == ItemType.limited_u and processed_item.limited == 'limited u') or
+        (item_type == ItemType.free and processed_item.free)
     )
 
+def shaped(records: List, shape: RecordShape) -> List[Dict]:
+    # Catalog items or game details in the requested JSON shape
+    if shape == RecordShape.compact:
+        return [record.compact() for record in records]
+    return [record.legacy() for record in records]
+
+def resume_cursor(token: str, endpoint: str) -> Cursor:
+    try:
+        return decode_cursor(token, endpoint)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def catalog_query(params: Dict) -> Tuple[Optional[str], int, int, ItemType, int]:
+    # (q, category, sort, item_type, limit) of the call a /catalog cursor was issued for,
+    # held to the same limits as the query parameters
+    try:
+        q, category, sort, limit = params.get('q'), params['category'], params['sort'], params['limit']
+        item_type = ItemType(params['item_type'])
+        if not (q is None or isinstance(q, str)) or type(category) is not int or type(sort) is not int \
+                or type(limit) is not int or category not in range(len(CATEGORY_DICT)) \
+                or sort not in range(len(SORT_DICT)) or limit <= 0:
+            raise ValueError
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    return q, category, sort, item_type, limit
+
 @app.get("/catalog")
 async def get_catalog(
-    session_cookie: str = Header('eyJjc3JmX3Rva2VuIjoiYmE0NDQ3MDUzM2FhNzFjOTZiMjQ3NjRlYmM4ZDJjNzAwMDU4NTY5MCJ9.ZW_8EA.Pw1spJO8Mss-8D7r18A71-a72to', description="User session cookie"),
-    security_cookie: str = Header('sAnHbclLJht1JilJR17QvWo9uHc2sqdLy61dB5RWKlZhAHlJ6SAT3epf3I5V992QzeX07K1y3wqAKIkb0N9L8SzHDez6wj2SqqKGw8DZCOXOn0y6Yhu9xIsiLV0b665GD5dUXqQq0T4EFXmsRy4fFkcASElaVGFpDsrK2zJ9vGuqkYWSIVWM0NWaW3eEdavemkqaikR9oltRKLGUu2y0Ub8iPuVqdsCs3nerpLbA9XCN5ZbaALJ4TbRfUDUNjl1sdK3SfsYup7LyysQTQqQmWYLikYHvHaGkhtFDREApkKQMKvRqIstt2PnsXH4uYFJtVkxbIAonRpyFcqoaAz6kYBuHovDMES61rq8WW65LFUJFgndcpiWb0liCw7N5KziQuA5m3OerXrrp3ELB0cxQnmr1GjqVlxRb7OvC9YlRJ4kjWqnSFxEMIyPXjoxfGcPeGevC3cKMhJprDH8KkF6hu1BZDldllTKfIEgq5tn55dZFcxEK2xfChJSDnkJwR4Tz', description="Security cookie"),
+    request: Request,
+    session_cookie: str = Header(DEFAULT_SESSION_COOKIE, description="User session cookie"),
+    security_cookie: str = Header(DEFAULT_SECURITY_COOKIE, description="Security cookie"),
     user_agent: Optional[str] = Header(None, description="User agent string"),
     q: Optional[str] = None,
     category: Optional[int] = Query(0, description="Category number", ge=0, le=len(CATEGORY_DICT) - 1),
     sort: Optional[int] = Query(0, description="Sort order number", ge=0, le=len(SORT_DICT) - 1),
     limit: Optional[int] = Query(10, description="Maximum number of results to return", gt=0),
-    item_type: Optional[ItemType] = Query(ItemType.all, description="Item type to filter (all, limited, limited_u, free)")
+    item_type: Optional[ItemType] = Query(ItemType.all, description="Item type to filter (all, limited, limited_u, free)"),
+    stream: Optional[StreamFormat] = Query(None, description="Stream items as they are scraped (ndjson, sse)"),
+    source: Optional[CatalogSource] = Query(CatalogSource.auto, description="Answer from the local catalog index or scrape live (auto, index, live)"),
+    shape: RecordShape = Query(RecordShape.legacy, description="JSON shape of the items (legacy, compact)"),
+    cursor: Optional[str] = Query(None, description="next_cursor of a previous call, to continue where it stopped (its query applies)")
 ):
+    # Resumed calls keep the limit the walk started with in the upstream URL, so they read the same pages
+    resumed, upstream_limit = None, limit
+    if cursor is not None:
+        resumed = resume_cursor(cursor, 'catalog')
+        q, category, sort, item_type, upstream_limit = catalog_query(resumed.params)
+        source = CatalogSource(resumed.source)
+
     category_name = process_category(category)
     sort_name = process_sort(sort)
-
-    # Set up the headers with the session and security cookies
-    headers = {
-        'User-Agent': user_agent,
-        'Cookie': f'.ROBLOSECURITY={security_cookie}; session={session_cookie}'
+    summary = {"category": category_name, "sort": sort_name, "item_type": item_type.value}
+
+    # Construct the query parameters
+    params = {
+        'q': q,
+        'category': category,
+        'sort': sort,
+        'limit': upstream_limit,
+        'item_type': item_type.value if item_type else None,
     }
 
-    # Create an aiohttp ClientSession with the headers
-    async with ClientSession(headers=headers) as session:
-        # Construct the base URL
-        base_url = "https://www.syntax.eco/catalog/"
-
-        # Construct the query parameters
-        params = {
-            'q': q,
-            'category': category,
-            'sort': sort,
-            'limit': limit,
-            'item_type': item_type.value if item_type else None,
-        }
-
-        # Remove parameters with None values
-        params = {k: v for k, v in params.items() if v is not None}
-
-        # Construct the search URL with query parameters
-        search_url = f"{base_url}?{urlencode(params)}" if params else base_url
-
-        # Make a GET request to the search URL
-        async with session.get(search_url) as response:
-            if response.status == 200:
-                # Parse the response content if needed
-                # soup = BeautifulSoup(await response.text(), 'html.parser')
-
-                # Use the function to handle pagination
-                data = await get_catalog_page(session, search_url, limit, item_type)
-
-                # Return the collected data with the limited number of results
-                return {"data": data, "category": category_name, "sort": sort_name, "item_type": item_type}
-            else:
-                logger.error(f"Failed to fetch the search page. Status Code: {response.status}")
-                return {"error": f"Failed to fetch the search page. Status Code: {response.status}"}
+    # Remove parameters with None values
+    params = {k: v for k, v in params.items() if v is not None}
 
-def extract_game_passes(response_text):
-    soup = BeautifulSoup(response_text, HTML_PARSER)
+    # Answer from the local catalog index when it is enabled and covers the query
+    search = catalog_search
+    if source != CatalogSource.live and search is not None and search.can_answer(category, sort):
+        offset = resumed.offset if resumed is not None else 0
+        result = search.search(q, category, sort, item_type.value, offset=offset, limit=limit)
+        data = result.items
+        end = offset + len(data)
+        next_cursor = encode_cursor(Cursor('catalog', params, offset=end, source='index')) if end < result.total else None
+        if stream:
+            return await stream_records(catalog_records(iter_items(data), summary, shape, lambda: next_cursor), stream)
+        return JSONResponse({"data": shaped(data, shape), "category": category_name, "sort": sort_name, "item_type": item_type,
+                             "next_cursor": next_cursor})
+    if source == CatalogSource.index:
+        raise HTTPException(status_code=503, detail="The local catalog index can't answer this query")
 
-    game_pass_container = soup.find('div', class_='tab-pane', id='nav-store')
+    # Send the session and security cookies with every upstream request
+    upstream = request.app.state.upstream.bind(build_headers(session_cookie, security_cookie, user_agent))
 
-    if game_pass_container:
-        game_passes = []
-        for game_pass in game_pass_container.find_all('div', class_='p-1'):
-            image = game_pass.find('img')['src']
-            name = game_pass.find('h5').text
-            price_text = game_pass.find('p', class_='text-robux').text.strip()
+    # Construct the base URL
+    base_url = f"{UPSTREAM_URL}/catalog/"
 
-            # Use regex to remove "R$" from the price
-            price = re.sub(r'[^\d.]', '', price_text)
+    # Construct the search URL with query parameters
+    search_url = f"{base_url}?{urlencode(params)}" if params else base_url
 
-            game_passes.append({
-                'image': image,
-                'name': name,
-                'price': price
-            })
+    # Pick up at the listing page and card the cursor points at
+    position = ListingPosition(resumed.page, resumed.offset) if resumed is not None else ListingPosition()
 
-        return game_passes
-    else:
+    def next_cursor() -> Optional[str]:
+        return None if position.exhausted else encode_cursor(Cursor('catalog', params, position.page, position.offset))
+
+    # Use the function to handle pagination
+    try:
+        if stream:
+            items = iter_catalog_items(upstream, search_url, limit, item_type, position=position)
+            return await stream_records(catalog_records(items, summary, shape, next_cursor), stream)
+
+        data = await get_catalog_page(upstream, search_url, limit, item_type, position=position)
+    except UpstreamError as e:
+        logger.error(f"Failed to fetch the search page. Status Code: {e.status}")
+        return {"error": f"Failed to fetch the search page. Status Code: {e.status}"}
+
+    # Return the collected data with the limited number of results
+    # The records are already plain JSON once shaped, so skip FastAPI's generic encoder
+    return JSONResponse({"data": shaped(data, shape), "category": category_name, "sort": sort_name, "item_type": item_type,
+                         "next_cursor": next_cursor()})
+
+class GameDetailsError(Exception):
+    pass
+
+async def load_games_page(upstream: BoundUpstream, url: str) -> Tuple[int, List[Optional[str]]]:
+    total_pages, game_paths = await load_page(
+        upstream, 'games', url, parse_games_listing,
+        on_load=lambda page: metrics.DROPPED_RECORDS.inc('game_card', amount=page[1].count(None)))
+    return total_pages, [f"{UPSTREAM_URL}{game_path}" if game_path else None for game_path in game_paths]
+
+async def fetch_game_cards(upstream: BoundUpstream, url: str) -> List[Optional[str]]:
+    try:
+        _, game_urls = await load_games_page(upstream, url)
+        return game_urls
+    except UpstreamError as e:
+        logger.error(f"Failed to fetch the games page {url}. Status Code: {e.status}")
         return []
 
+def game_id(game_url: str) -> Optional[int]:
+    match = re.search(r'/games/(\d+)', urlsplit(game_url).path)
+    return int(match.group(1)) if match else None
 
-def process_game_details(game):
-    try:
-        game_title = game.find('h1', class_='m-0').get_text(strip=True)
-        creator_name = game.find('p', class_='m-0').find('a').get_text(strip=True)
-        favorites_count = int(
-            game.find('div', class_='icon-favorite').find_next('span', class_='text-favorite').get_text(strip=True))
-        likes_count = int(
-            game.find('div', class_='upvote').find_next('span', class_='vote-up-text').get_text(strip=True))
-        dislikes_count = int(game.find('span', class_='vote-down-text').text)
-        description = game.find('div', class_='ms-2').get_text(strip=True)
-        builder_club_required = "Yes" if game.find('p',
-                                                   string='A Builders Club membership is required to join this game') else "No"
-        thumbnail_source = game.find('img', class_='rounded')['src']
-        active_players = int(game.find('div', class_='col').find_next('h2').get_text(strip=True))
-        visits_count = int(
-            game.find('div', class_='col').find_next('div', class_='col').find_next('h2').get_text(strip=True))
-        created_date = game.find('div', class_='col').find_next('div', class_='col').find_next('div',
-                                                                                               class_='col').find_next(
-            'h2').get_text(strip=True)
-        updated_date = game.find('div', class_='col').find_next('div', class_='col').find_next('div',
-                                                                                               class_='col').find_next(
-            'div', class_='col').find_next('h2').get_text(strip=True)
-        server_size = int(
-            game.find('div', class_='col').find_next('div', class_='col').find_next('div', class_='col').find_next(
-                'div', class_='col').find_next('div', class_='col').find_next('h2').get_text(strip=True))
-
-        game_passes = extract_game_passes(game.prettify())
-
-        game_info = {
-            "Game Title": game_title,
-            "Creator Name": creator_name,
-            "Favorites Count": favorites_count,
-            "Likes Count": likes_count,
-            "Dislikes Count": dislikes_count,
-            "Description": description,
-            "Builder Club Required": builder_club_required,
-            "Thumbnail Source": thumbnail_source,
-            "Active Players": active_players,
-            "Visits Count": visits_count,
-            "Created Date": created_date,
-            "Updated Date": updated_date,
-            "Server Size": server_size,
-            "Game Passes": game_passes,
-        }
-
-        return game_info
+def game_page_url(game_id: int) -> str:
+    return f"{UPSTREAM_URL}/games/{game_id}/"
 
-    except Exception as e:
-        logger.error(f"Error processing game details: {e}")
-        return None
+async def fetch_game_details(upstream: BoundUpstream, game_url: Optional[str]) -> Tuple[Optional[GameDetails], Optional[str]]:
+    # Returns (game details, None) on success and (None, error message) on failure.
+    # Details are cached by game id, so a game's page is shared by every link to it.
+    if not game_url:
+        return None, "Game card has no link"
+    detail_id = game_id(game_url)
+    cache_url = game_page_url(detail_id) if detail_id is not None else game_url
+
+    def dropped(processed_game: Optional[GameDetails]):
+        if processed_game is None:
+            metrics.DROPPED_RECORDS.inc('game_details')
 
+    async def load():
+        # Process the game details; pages the details can't be extracted from are not cached
+        processed_game = await fetch_parsed(upstream, 'game', game_url, parse_game_page, on_load=dropped)
+        if processed_game is None:
+            raise GameDetailsError("Failed to extract the game details")
+        return processed_game
 
-async def get_game_page(session: ClientSession, url: str, limit: int) -> List:
+    try:
+        return await page_cache.get_or_load('game', cache_url, load, variant=parse_game_page.__name__), None
+    except asyncio.CancelledError:
+        raise
+    except UpstreamError as e:
+        return None, f"Failed to fetch the game page. Status Code: {e.status}"
+    except GameDetailsError as e:
+        return None, str(e)
+    except Exception as e:
+        return None, f"Failed to fetch the game page: {e}"
+
+async def iter_game_results(upstream: BoundUpstream, url: str, limit: int,
+                            position: ListingPosition = None) -> AsyncIterator[Tuple[Optional[str], Optional[GameDetails], Optional[str]]]:
+    # Yields (game url, game details, error) in listing order as each detail page is
+    # processed, until limit games have been processed successfully. Starts at
+    # position (the first card by default) and keeps it just past the last card yielded.
+    count = 0
+    position = position or ListingPosition()
+
+    # Listing pages are prefetched while the detail pages of the current one are in flight
+    pages = walk_listing_pages(upstream, url, load_games_page, fetch_game_cards, GAMES_MAX_INFLIGHT_PAGES, wanted=limit,
+                               position=position)
+    tasks = []
+    try:
+        page_number, index = position.page, position.offset
+        async for game_urls in pages:
+            # Only fetch as many details as are still needed, then top up from the
+            # remaining cards if some of them failed
+            while index < len(game_urls) and count < limit:
+                batch = game_urls[index:index + limit - count]
+                tasks = [asyncio.ensure_future(fetch_game_details(upstream, game_url)) for game_url in batch]
+
+                for game_url, task in zip(batch, tasks):
+                    processed_game, error = await task
+                    index += 1
+                    position.at(page_number, index, len(game_urls))
+                    if processed_game:
+                        count += 1
+                    else:
+                        logger.error(f"Failed to process the game page {game_url}: {error}")
+                    yield game_url, processed_game, error
+
+            if count >= limit:
+                break  # Exit the loop if the limit is reached
+            page_number, index = page_number + 1, 0
+            position.at(page_number, 0)
+    except UpstreamError as e:
+        logger.error(f"Failed to fetch the game page {url}. Status Code: {e.status}")
+    finally:
+        # Cancel detail fetches the consumer no longer wants
+        for task in tasks:
+            task.cancel()
+        await pages.aclose()
+
+async def get_game_page(upstream: BoundUpstream, url: str, limit: int,
+                        position: ListingPosition = None) -> Tuple[List[GameDetails], List[Dict]]:
     data = []  # List to store detailed game information
-    async with session.get(url) as response:
-        if response.status == 200:
-            content = await response.text()
-            soup = BeautifulSoup(content, 'html5lib')
+    errors = []  # Game pages that could not be fetched or processed
+
+    results = iter_game_results(upstream, url, limit, position)
+    try:
+        async for game_url, processed_game, error in results:
+            if processed_game:
+                data.append(processed_game)
+            else:
+                errors.append({"url": game_url, "error": error})
+    finally:
+        await results.aclose()
+
+    return data[:limit], errors  # Return the data up to the limit
 
-            # Find the element containing information about total pages
-            page_info = soup.find('p', class_=re.compile('m-0 ms-2 me-2 text-white'))
-            total_pages = extract_total_pages(page_info.text) if page_info else 1
 
-            for page_number in range(1, total_pages + 1):
-                if len(data) >= limit:
-                    break  # Exit the loop if the limit is reached
+def games_query(params: Dict) -> Tuple[Optional[str], int]:
+    # (q, limit) of the call a /games cursor was issued for
+    q, limit = params.get('q'), params.get('limit')
+    if not (q is None or isinstance(q, str)) or type(limit) is not int or limit <= 0:
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    return q, limit
 
-                page_url = f"{url}?page={page_number}"
-                async with session.get(page_url) as games_page_response:
-                    games_page_content = await games_page_response.text()
-                    games_page_soup = BeautifulSoup(games_page_content, 'html5lib')
+@app.get("/games")
+async def get_games(
+    request: Request,
+    session_cookie: str = Header(DEFAULT_SESSION_COOKIE, description="User session cookie"),
+    security_cookie: str = Header(DEFAULT_SECURITY_COOKIE, description="Security cookie"),
+    user_agent: Optional[str] = Header(None, description="User agent string"),
+    q: Optional[str] = None,
+    limit: Optional[int] = Query(10, description="Maximum number of results to return", gt=0),
+    stream: Optional[StreamFormat] = Query(None, description="Stream games as they are scraped (ndjson, sse)"),
+    shape: RecordShape = Query(RecordShape.legacy, description="JSON shape of the games (legacy, compact)"),
+    cursor: Optional[str] = Query(None, description="next_cursor of a previous call, to continue where it stopped (its query applies)")
+):
+    # Resumed calls keep the limit the walk started with in the upstream URL, so they read the same pages
+    resumed, upstream_limit = None, limit
+    if cursor is not None:
+        resumed = resume_cursor(cursor, 'games')
+        q, upstream_limit = games_query(resumed.params)
+
+    # Send the session and security cookies with every upstream request
+    upstream = request.app.state.upstream.bind(build_headers(session_cookie, security_cookie, user_agent))
+
+    # Construct the base URL
+    base_url = f"{UPSTREAM_URL}/games/popular/view"
+
+    # Construct the query parameters
+    params = {
+        'q': q,
+        'limit': upstream_limit,
+    }
 
-                    games = games_page_soup.find_all('a', class_='text-decoration-none p-1 col-xxl-2 col-lg-3 col-md-4 col-sm-6')
+    # Remove parameters with None values
+    params = {k: v for k, v in params.items() if v is not None}
 
-                    for game in games:
-                        if len(data) >= limit:
-                            break  # Exit the loop if the limit is reached
+    # Construct the search URL with query parameters
+    search_url = f"{base_url}?{urlencode(params)}" if params else base_url
 
-                        game_url_relative = game.get('href', '').strip()
-                        game_url = f"https://www.syntax.eco{game_url_relative}" if game_url_relative else None
+    # Pick up at the listing page and card the cursor points at
+    position = ListingPosition(resumed.page, resumed.offset) if resumed is not None else ListingPosition()
 
-                        async with session.get(game_url) as game_page_response:
-                            game_page_content = await game_page_response.text()
-                            game_page_soup = BeautifulSoup(game_page_content, 'html5lib')
+    def next_cursor() -> Optional[str]:
+        return None if position.exhausted else encode_cursor(Cursor('games', params, position.page, position.offset))
 
-                            # Process the game details
-                            processed_game = process_game_details(game_page_soup)
+    if stream:
+        return await stream_records(game_records(upstream, search_url, limit, {"query": q}, shape, position, next_cursor),
+                                    stream)
 
-                            if processed_game:
-                                data.append(processed_game)
-        else:
-            logger.error(f"Failed to fetch the game page {url}. Status Code: {response.status}")
+    # Use the new async function to handle pagination and fetch game details
+    data, errors = await get_game_page(upstream, search_url, limit, position)
 
-    return data[:limit]  # Return the data up to the limit
+    # Return the collected data with the limited number of results
+    return JSONResponse({"data": shaped(data, shape), "errors": errors, "query": q, "next_cursor": next_cursor()})
 
 
-@app.get("/games")
-async def get_games(
-    session_cookie: str = Header('eyJjc3JmX3Rva2VuIjoiYmE0NDQ3MDUzM2FhNzFjOTZiMjQ3NjRlYmM4ZDJjNzAwMDU4NTY5MCJ9.ZW_8EA.Pw1spJO8Mss-8D7r18A71-a72to', description="User session cookie"),
-    security_cookie: str = Header('sAnHbclLJht1JilJR17QvWo9uHc2sqdLy61dB5RWKlZhAHlJ6SAT3epf3I5V992QzeX07K1y3wqAKIkb0N9L8SzHDez6wj2SqqKGw8DZCOXOn0y6Yhu9xIsiLV0b665GD5dUXqQq0T4EFXmsRy4fFkcASElaVGFpDsrK2zJ9vGuqkYWSIVWM0NWaW3eEdavemkqaikR9oltRKLGUu2y0Ub8iPuVqdsCs3nerpLbA9XCN5ZbaALJ4TbRfUDUNjl1sdK3SfsYup7LyysQTQqQmWYLikYHvHaGkhtFDREApkKQMKvRqIstt2PnsXH4uYFJtVkxbIAonRpyFcqoaAz6kYBuHovDMES61rq8WW65LFUJFgndcpiWb0liCw7N5KziQuA5m3OerXrrp3ELB0cxQnmr1GjqVlxRb7OvC9YlRJ4kjWqnSFxEMIyPXjoxfGcPeGevC3cKMhJprDH8KkF6hu1BZDldllTKfIEgq5tn55dZFcxEK2xfChJSDnkJwR4Tz', description="Security cookie"),
+@app.post("/games/batch")
+async def get_games_batch(
+    request: Request,
+    ids: List[int] = Body(..., embed=True, description="Game ids to fetch the details of"),
+    session_cookie: str = Header(DEFAULT_SESSION_COOKIE, description="User session cookie"),
+    security_cookie: str = Header(DEFAULT_SECURITY_COOKIE, description="Security cookie"),
     user_agent: Optional[str] = Header(None, description="User agent string"),
-    q: Optional[str] = None,
-    limit: Optional[int] = Query(10, description="Maximum number of results to return", gt=0),
+    shape: RecordShape = Query(RecordShape.legacy, description="JSON shape of the games (legacy, compact)")
 ):
-    # Set up the headers with the session and security cookies
-    headers = {
-        'User-Agent': user_agent,
-        'Cookie': f'.ROBLOSECURITY={security_cookie}; session={session_cookie}'
-    }
+    # Details of the given games, fetched concurrently (bounded by the upstream client's per-host limiter)
+    # without going through any listing page, and served from the detail cache when fresh
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > GAME_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {GAME_BATCH_MAX_IDS} game ids per batch")
+
+    upstream = request.app.state.upstream.bind(build_headers(session_cookie, security_cookie, user_agent))
+    results = await asyncio.gather(*(fetch_game_details(upstream, game_page_url(game)) for game in ids))
+
+    data, errors = {}, {}
+    for game, (processed_game, error) in zip(ids, results):
+        if processed_game:
+            data[str(game)] = shaped([processed_game], shape)[0]
+        else:
+            logger.error(f"Failed to process the game page {game_page_url(game)}: {error}")
+            errors[str(game)] = error
+    return JSONResponse({"data": data, "errors": errors})
+
+
+def encode_record(record_type: str, record: Dict, stream_format: StreamFormat) -> str:
+    if stream_format == StreamFormat.sse:
+        return f"event: {record_type}\ndata: {json.dumps(record, ensure_ascii=False)}\n\n"
+    return json.dumps({"type": record_type, "data": record}, ensure_ascii=False) + "\n"
 
-    # Create an aiohttp ClientSession with the headers
-    async with ClientSession(headers=headers) as session:
-        # Construct the base URL
-        base_url = "https://www.syntax.eco/games/popular/view"
-
-        # Construct the query parameters
-        params = {
-            'q': q,
-            'limit': limit,
-        }
-
-        # Remove parameters with None values
-        params = {k: v for k, v in params.items() if v is not None}
-
-        # Construct the search URL with query parameters
-        search_url = f"{base_url}?{urlencode(params)}" if params else base_url
-        logger.info("Cookies before request:")
-        for cookie in session.cookie_jar:
-            logger.info(
-                f"Name: {cookie.key}, Value: {cookie.value}, Domain: {cookie['domain']}, Path: {cookie['path']}")
-        # Use the new async function to handle pagination and fetch game details
-        data = await get_game_page(session, search_url, limit)
-
-        # Return the collected data with the limited number of results
-        return {"data": data, "query": q}
\ No newline at end of file
+async def stream_records(records: AsyncIterator[Tuple[str, Dict]], stream_format: StreamFormat) -> StreamingResponse:
+    # Stream (record type, record) pairs as NDJSON lines or server-sent events. The first
+    # record is pulled before the response starts, so a failure to load the first
+    # upstream page is still raised to the endpoint instead of cutting the stream short.
+    try:
+        first_record = await records.__anext__()
+    except StopAsyncIteration:
+        first_record = None
+    except BaseException:
+        await records.aclose()
+        raise
+
+    async def body():
+        try:
+            if first_record is not None:
+                yield encode_record(*first_record, stream_format)
+            async for record in records:
+                yield encode_record(*record, stream_format)
+        finally:
+            await records.aclose()
+
+    return StreamingResponse(body(), media_type=STREAM_MEDIA_TYPES[stream_format])
+
+async def catalog_records(items: AsyncIterator[CatalogItem], summary: Dict, shape: RecordShape = RecordShape.legacy,
+                          next_cursor: Callable[[], Optional[str]] = None) -> AsyncIterator[Tuple[str, Dict]]:
+    # The summary closes the stream, with the cursor to continue from if next_cursor is given
+    count = 0
+    try:
+        async for item in items:
+            count += 1
+            yield "item", item.compact() if shape == RecordShape.compact else item.legacy()
+    finally:
+        await items.aclose()
+
+    yield "summary", dict(summary, count=count, **({"next_cursor": next_cursor()} if next_cursor else {}))
+
+async def game_records(upstream: BoundUpstream, url: str, limit: int, summary: Dict,
+                       shape: RecordShape = RecordShape.legacy, position: ListingPosition = None,
+                       next_cursor: Callable[[], Optional[str]] = None) -> AsyncIterator[Tuple[str, Dict]]:
+    count = errors = 0
+    results = iter_game_results(upstream, url, limit, position)
+    try:
+        async for game_url, processed_game, error in results:
+            if processed_game:
+                count += 1
+                yield "game", processed_game.compact() if shape == RecordShape.compact else processed_game.legacy()
+            else:
+                errors += 1
+                yield "error", {"url": game_url, "error": error}
+    finally:
+        await results.aclose()
+
+    yield "summary", dict(summary, count=count, errors=errors, **({"next_cursor": next_cursor()} if next_cursor else {}))
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    # Page cache hit, miss and eviction counters, and how often reloaded pages came back unchanged
+    return dict(page_cache.stats(), page_store=page_store.stats())
+
+@app.get("/upstream/stats")
+async def get_upstream_stats(request: Request):
+    # Throttle and circuit breaker state of every upstream host
+    return request.app.state.upstream.stats()
+
+def upstream_host_stats() -> Dict[Tuple, float]:
+    upstream = getattr(app.state, 'upstream', None)
+    if upstream is None:
+        return {}
+    return {(host, stat): value for host, stats in upstream.stats().items()
+            for stat, value in stats.items() if stat != 'state'}
+
+def upstream_circuit_states() -> Dict[Tuple, float]:
+    upstream = getattr(app.state, 'upstream', None)
+    if upstream is None:
+        return {}
+    return {(host, state): int(stats['state'] == state) for host, stats in upstream.stats().items()
+            for state in ('closed', 'open', 'half_open')}
+
+metrics.registry.register(metrics.Gauge(
+    'scraper_page_cache', "Page cache counters and sizes, as in /cache/stats", ('stat',),
+    lambda: {(stat,): value for stat, value in page_cache.stats().items()}))
+metrics.registry.register(metrics.Gauge(
+    'scraper_page_store', "Raw page store counters and sizes: reloads that came back not modified or unchanged",
+    ('stat',), lambda: {(stat,): value for stat, value in page_store.stats().items()}))
+metrics.registry.register(metrics.Gauge(
+    'scraper_parse_pool', "Parse pool workers and pages being parsed", ('executor', 'stat'),
+    lambda: {(parsing.parse_pool.kind, stat): value for stat, value in parsing.parse_pool.stats().items()}))
+metrics.registry.register(metrics.Gauge(
+    'scraper_upstream_host', "Throttle and circuit breaker counters of every upstream host, as in /upstream/stats",
+    ('host', 'stat'), upstream_host_stats))
+metrics.registry.register(metrics.Gauge(
+    'scraper_upstream_circuit_state', "1 for the current circuit breaker state of every upstream host",
+    ('host', 'state'), upstream_circuit_states))
+metrics.registry.register(metrics.Gauge(
+    'scraper_price_history', "Assets and samples in the price history", ('stat',),
+    lambda: {(stat,): value for stat, value in price_history.stats().items()}))
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition of every metric
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/catalog/history")
+async def get_price_summaries(
+    asset_id: List[int] = Query(..., description="Asset ids to summarize"),
+    field: PriceField = Query(PriceField.robux, description="Price to summarize (robux, tickets, now)"),
+    start: Optional[int] = Query(None, description="Unix time to summarize from (defaults to the first sample)"),
+    end: Optional[int] = Query(None, description="Unix time to summarize up to (defaults to now)")
+):
+    # First, last, min and max price of many assets at once, for dashboards
+    summaries = price_history.aggregate(asset_id, field.value, start, end)
+    return {"field": field, "data": {str(item_id): summary for item_id, summary in summaries.items()}}
+
+@app.get("/catalog/{asset_id}/history")
+async def get_price_history(
+    asset_id: int,
+    field: PriceField = Query(PriceField.robux, description="Price to downsample (robux, tickets, now)"),
+    bucket: int = Query(3600, description="Bucket width in seconds", gt=0),
+    start: Optional[int] = Query(None, description="Unix time of the first bucket (defaults to the first sample, "
+                                                   f"at most {MAX_HISTORY_BUCKETS} buckets back)"),
+    end: Optional[int] = Query(None, description="Unix time of the last bucket (defaults to now)")
+):
+    # Price of one asset over time, downsampled to the min, max and last price per bucket
+    try:
+        points = price_history.history(asset_id, field.value, bucket, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if points is None:
+        raise HTTPException(status_code=404, detail="No price history for this asset")
+    return {"asset_id": asset_id, "field": field, "bucket": bucket, "data": points}
+
+@app.get("/catalog/index/stats")
+async def get_catalog_index_stats():
+    # Size and last crawl times (unix time) of the local catalog index
+    if catalog_store is None:
+        raise HTTPException(status_code=404, detail="The local catalog index is not enabled")
+    stats = await catalog_store.call(catalog_store.stats)
+    if catalog_search is not None:
+        stats["search"] = catalog_search.stats()
+    return stats
@@ -0,0 +1,228 @@
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Counters and histograms of the scrape pipeline, rendered in the Prometheus text
+# format by /metrics. Observing is a dict lookup and a bisect, cheap enough to
+# leave on for every request.
+
+# Add a Server-Timing header with the per-stage breakdown of each request
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') not in ('0', 'false', 'no')
+
+# Histogram bucket upper bounds (seconds) for page fetches and parses, and for single record processing
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECORD_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+# Upstream pages fetched for one API request
+PAGE_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}'
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        label_values = tuple(map(str, label_values))
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in sorted(self.values.items()):
+            yield f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}"
+
+
+class Histogram(Metric):
+    # Cumulative buckets are only summed up when rendered; observing bumps one slot
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        # Label values are kept as strings, so a status that is 200 or 'error' still sorts
+        label_values = tuple(map(str, label_values))
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self) -> Iterable[str]:
+        bucket_labels = self.labels + ('le',)
+        for label_values, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                labels = format_labels(bucket_labels, (*label_values, format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge(Metric):
+    # Read when rendered: collect returns {label values: value}
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 collect: Callable[[], Dict[Tuple, float]] = dict):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in sorted(self.collect().items()):
+            yield f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+UPSTREAM_FETCH_SECONDS = registry.register(Histogram(
+    'scraper_upstream_fetch_seconds', "Time to fetch one upstream page, including throttling and retries",
+    ('page', 'status')))
+PARSE_SECONDS = registry.register(Histogram(
+    'scraper_parse_seconds', "Time to parse one upstream page, including the hand off to the parse pool",
+    ('parser',)))
+PARSE_STAGE_SECONDS = registry.register(Histogram(
+    'scraper_parse_stage_seconds', "Time spent in one call of a parse stage inside the parse pool",
+    ('stage',), buckets=RECORD_BUCKETS))
+DROPPED_RECORDS = registry.register(Counter(
+    'scraper_dropped_records_total', "Cards and pages dropped because nothing could be extracted from them",
+    ('kind',)))
+REQUEST_PAGES = registry.register(Histogram(
+    'scraper_request_upstream_pages', "Upstream pages fetched (not served from the cache) per API request",
+    ('endpoint',), buckets=PAGE_COUNT_BUCKETS))
+REQUEST_SECONDS = registry.register(Histogram(
+    'scraper_request_seconds', "Time to answer an API request, up to the end of the response body",
+    ('endpoint', 'status')))
+
+
+class RequestTrace:
+    # Per-request tally of upstream pages and the time spent per stage. Tasks spawned
+    # while handling a request inherit its context, so concurrent fetches add to the
+    # same trace; stage durations are summed, so they can exceed the request's wall time.
+
+    __slots__ = ('start', 'pages', 'stages')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.pages = 0
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        entries = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in self.stages.items()]
+        entries.append(f'pages;desc="{self.pages}"')
+        entries.append(f'total;dur={(time.perf_counter() - self.start) * 1000:.1f}')
+        return ', '.join(entries)
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar('current_trace', default=None)
+
+
+def record_fetch(page: str, status, seconds: float):
+    UPSTREAM_FETCH_SECONDS.observe(seconds, page, status)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.pages += 1
+        trace.add('upstream', seconds)
+
+
+def record_parse(parser: str, seconds: float, stages: Dict[str, List[float]]):
+    PARSE_SECONDS.observe(seconds, parser)
+    for stage, durations in stages.items():
+        for duration in durations:
+            PARSE_STAGE_SECONDS.observe(duration, stage)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add('parse', seconds)
+
+
+class MetricsMiddleware:
+    # ASGI middleware tracing every HTTP request: pages fetched and total time are
+    # observed once the response body has been sent (streams included), and with
+    # SERVER_TIMING on the breakdown so far is sent in a Server-Timing header. For
+    # a streamed response that covers the work done before its first record.
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        trace = RequestTrace()
+        token = current_trace.set(trace)
+        status = 500
+
+        async def send_traced(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if self.server_timing:
+                    message['headers'] = [*message.get('headers', ()),
+                                          (b'server-timing', trace.server_timing().encode('latin-1'))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            current_trace.reset(token)
+            route = scope.get('route')
+            endpoint = getattr(route, 'path', None) or 'unmatched'
+            REQUEST_PAGES.observe(trace.pages, endpoint)
+            REQUEST_SECONDS.observe(time.perf_counter() - trace.start, endpoint, status)
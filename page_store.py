@@ -0,0 +1,93 @@
+import hashlib
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from cache import normalize_url
+
+# Maximum number of upstream pages kept before the least recently used ones are dropped
+PAGE_STORE_MAX_ENTRIES = 2048
+# zlib level raw bodies are kept at; pages are only decompressed when re-parsed
+PAGE_STORE_COMPRESSION = 1
+
+
+def content_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+class StoredPage:
+    # Last body seen for one upstream URL with its validators and what it parsed to, by parser name
+
+    __slots__ = ('etag', 'last_modified', 'digest', 'body', 'parsed')
+
+    def __init__(self, etag: Optional[str], last_modified: Optional[str], digest: bytes, body: bytes):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.body = body
+        self.parsed: Dict[str, Any] = {}
+
+    def text(self) -> str:
+        return zlib.decompress(self.body).decode('utf-8', 'surrogatepass')
+
+    def validators(self) -> Dict[str, str]:
+        # Request headers that make the next fetch of this page conditional
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class PageStore:
+    # Raw upstream pages by URL, so refetching one can be a conditional GET and a page
+    # that comes back unchanged (304, or 200 with the same content) is not parsed again.
+    # Unlike the page cache, entries never expire; they are only ever used to revalidate.
+
+    def __init__(self, max_entries: int = PAGE_STORE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.pages: 'OrderedDict[Hashable, StoredPage]' = OrderedDict()
+        self.counters = {'not_modified': 0, 'unchanged': 0, 'changed': 0, 'new': 0}
+
+    def get(self, url: str) -> Optional[StoredPage]:
+        key = normalize_url(url)
+        page = self.pages.get(key)
+        if page is not None:
+            self.pages.move_to_end(key)
+        return page
+
+    def not_modified(self, page: StoredPage, etag: Optional[str], last_modified: Optional[str]) -> StoredPage:
+        # A 304 for page; it may carry updated validators
+        self.counters['not_modified'] += 1
+        page.etag = etag or page.etag
+        page.last_modified = last_modified or page.last_modified
+        return page
+
+    def put(self, url: str, text: str, etag: Optional[str], last_modified: Optional[str]) -> StoredPage:
+        # Store a freshly downloaded body. The stored page (and its parse results) is kept
+        # if the content is the same as before, so callers can tell by what it has parsed.
+        key = normalize_url(url)
+        digest = content_digest(text)
+        page = self.pages.get(key)
+        if page is not None and page.digest == digest:
+            self.counters['unchanged'] += 1
+            page.etag, page.last_modified = etag, last_modified
+            self.pages.move_to_end(key)
+            return page
+
+        self.counters['changed' if page is not None else 'new'] += 1
+        page = self.pages[key] = StoredPage(etag, last_modified, digest,
+                                            zlib.compress(text.encode('utf-8', 'surrogatepass'),
+                                                          PAGE_STORE_COMPRESSION))
+        self.pages.move_to_end(key)
+        while len(self.pages) > self.max_entries:
+            self.pages.popitem(last=False)
+        return page
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counters, entries=len(self.pages), max_entries=self.max_entries,
+                    body_bytes=sum(len(page.body) for page in self.pages.values()))
+
+    def clear(self):
+        self.pages.clear()
@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial as bind, wraps
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+import metrics
+from records import CatalogItem, GameDetails, GamePass
+
+logger = logging.getLogger(__name__)
+
+
+def default_html_parser():
+    # lxml is by far the fastest tree builder bs4 supports; fall back to the
+    # stdlib parser when it is not installed
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return 'html.parser'
+    return 'lxml'
+
+
+# Tree builder used for every page ('lxml', 'html.parser' or 'html5lib')
+HTML_PARSER = os.environ.get('HTML_PARSER') or default_html_parser()
+# Only build the parts of listing pages that are actually read (ignored by html5lib). Off
+# by default: check it against recorded live pages first (benchmark.py parsers --catalog-page
+# / --games-page), since a card outside the strained tags would be dropped without an error
+HTML_PARTIAL_PARSING = os.environ.get('HTML_PARTIAL_PARSING', '0') not in ('0', 'false', 'no')
+
+# Listing pages are only read for their cards (item cards are rendered inside
+# their <a> links) and the "Page x of y" counter paragraph
+CATALOG_LISTING = SoupStrainer(['a', 'p'])
+GAMES_LISTING = SoupStrainer(['a', 'p'])
+
+# Where page parsing runs: 'process' (process pool), 'thread' (thread pool) or 'inline' (on the event loop)
+PARSE_EXECUTOR = os.environ.get('PARSE_EXECUTOR', 'process')
+# Number of parse workers; defaults to one per CPU
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 0)) or os.cpu_count() or 1
+
+GAME_CARD_CLASS = 'text-decoration-none p-1 col-xxl-2 col-lg-3 col-md-4 col-sm-6'
+
+# Stage timings of the page the current thread is parsing; see parse_timed
+parse_state = threading.local()
+
+
+def timed(stage: str):
+    # Record how long each call takes under stage while parse_timed is collecting;
+    # outside of it the wrapped function runs as is
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            stages = getattr(parse_state, 'stages', None)
+            if stages is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stages.setdefault(stage, []).append(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@timed('make_soup')
+def make_soup(markup, parse_only: SoupStrainer = None, parser: str = None, partial: bool = None) -> BeautifulSoup:
+    parser = parser or HTML_PARSER
+    partial = HTML_PARTIAL_PARSING if partial is None else partial
+
+    if parse_only is None or not partial or parser == 'html5lib':
+        return BeautifulSoup(markup, parser)
+    return BeautifulSoup(markup, parser, parse_only=parse_only)
+
+
+def extract_total_pages(text):
+    match = re.search(r'Page \d+ of (\d+)', text)
+    return int(match.group(1)) if match else 1
+
+@timed('process_item')
+def process_item(item):
+    try:
+        item_name = item.find('p', class_='text-secondary').text.strip()
+        item_price_robux = item.find('p', class_='text-robux')
+        item_price_tickets = item.find('p', class_='text-tickets')
+
+        robux_price = int(re.search(r'\d+', item_price_robux.text).group()) if item_price_robux and re.search(
+            r'\d+', item_price_robux.text) else None
+        tickets_price = int(
+            re.search(r'\d+', item_price_tickets.text).group()) if item_price_tickets and re.search(r'\d+',
+                                                                                                    item_price_tickets.text) else None
+
+        price_change_tag = item.find('span', class_='text-secondary fw-normal', string='now')
+        price_change_now = int(
+            re.search(r'\d+', price_change_tag.next_sibling).group()) if price_change_tag and re.search(r'\d+',
+                                                                                                        price_change_tag.next_sibling) else None
+        price_change_was_tag = item.find('span', class_='text-secondary fw-normal', string='was')
+        price_change_was = int(
+            re.search(r'\d+', price_change_was_tag.next_sibling).group()) if price_change_was_tag and re.search(
+            r'\d+', price_change_was_tag.next_sibling) else None
+
+        # None when the card shows no price change; a missing side of it is Free (None)
+        if price_change_was is None and price_change_now is None:
+            price_change = None
+        else:
+            price_change = (price_change_was, price_change_now)
+
+        limited_tag = item.find('p', class_='position-absolute m-0 fw-bold text-limited')
+        limited_u_tag = limited_tag.find('span', class_='text-limitedu') if limited_tag else None
+
+        limited = "limited u" if limited_u_tag else ("limited" if limited_tag else None)
+
+        item_link_tag = item.find_parent('a', href=True)
+        item_link_relative = item_link_tag['href'].strip() if item_link_tag else None
+        item_link = f"https://www.syntax.eco{item_link_relative}" if item_link_relative else None
+
+        img_src = item.find('img')['src'].strip()
+        item_image = f"https://www.syntax.eco{img_src}" if img_src else None
+
+        return CatalogItem(item_name, robux_price, tickets_price, price_change, limited, item_link, item_image)
+
+    except Exception as e:
+        logger.error(f"Error processing an item: {e}")
+        return None
+
+
+def extract_game_passes(page):
+    # page is either the already parsed game page or its markup
+    soup = make_soup(page) if isinstance(page, (str, bytes)) else page
+
+    game_pass_container = soup.find('div', class_='tab-pane', id='nav-store')
+
+    if game_pass_container:
+        game_passes = []
+        for game_pass in game_pass_container.find_all('div', class_='p-1'):
+            image = game_pass.find('img')['src']
+            name = game_pass.find('h5').text
+            price_text = game_pass.find('p', class_='text-robux').text.strip()
+
+            # Use regex to remove "R$" from the price
+            price = re.sub(r'[^\d.]', '', price_text)
+
+            game_passes.append(GamePass(image, name, price))
+
+        return game_passes
+    else:
+        return []
+
+
+@timed('process_game_details')
+def process_game_details(game):
+    try:
+        game_title = game.find('h1', class_='m-0').get_text(strip=True)
+        creator_name = game.find('p', class_='m-0').find('a').get_text(strip=True)
+        favorites_count = int(
+            game.find('div', class_='icon-favorite').find_next('span', class_='text-favorite').get_text(strip=True))
+        likes_count = int(
+            game.find('div', class_='upvote').find_next('span', class_='vote-up-text').get_text(strip=True))
+        dislikes_count = int(game.find('span', class_='vote-down-text').text)
+        description = game.find('div', class_='ms-2').get_text(strip=True)
+        builder_club_required = game.find('p', string='A Builders Club membership is required to join this game') is not None
+        thumbnail_source = game.find('img', class_='rounded')['src']
+
+        # The stats row: locate its first column once and read the h2 of every column in order
+        stats = [h2.get_text(strip=True) for h2 in game.find('div', class_='col').find_all_next('h2', limit=5)]
+        active_players, visits_count, created_date, updated_date, server_size = stats
+        active_players = int(active_players)
+        visits_count = int(visits_count)
+        server_size = int(server_size)
+
+        # Read the game passes from the tree we already have
+        game_passes = extract_game_passes(game)
+
+        return GameDetails(game_title, creator_name, favorites_count, likes_count, dislikes_count, description,
+                           builder_club_required, thumbnail_source, active_players, visits_count, created_date,
+                           updated_date, server_size, game_passes)
+
+    except Exception as e:
+        logger.error(f"Error processing game details: {e}")
+        return None
+
+
+# Page level parsers. They take the raw page markup and only return plain data so
+# they can run in a worker process.
+
+def parse_catalog_listing(markup: str) -> Tuple[int, List[Optional[CatalogItem]]]:
+    # Every listing page carries the "Page x of y" counter, so page 1 also gives the page count
+    soup = make_soup(markup, CATALOG_LISTING)
+    page_info = soup.find('p', class_='ms-2 me-2 text-white')
+    total_pages = extract_total_pages(page_info.text) if page_info else 1
+    return total_pages, [process_item(item) for item in soup.find_all(class_='item-card')]
+
+
+def parse_games_listing(markup: str) -> Tuple[int, List[Optional[str]]]:
+    # Returns the page count and the relative link of every game card (None if it has none)
+    soup = make_soup(markup, GAMES_LISTING)
+    page_info = soup.find('p', class_=re.compile('m-0 ms-2 me-2 text-white'))
+    total_pages = extract_total_pages(page_info.text) if page_info else 1
+
+    return total_pages, [game.get('href', '').strip() or None for game in soup.find_all('a', class_=GAME_CARD_CLASS)]
+
+
+def parse_game_page(markup: str) -> Optional[GameDetails]:
+    return process_game_details(make_soup(markup))
+
+
+class ParsePool:
+    # Runs the page parsers off the event loop so one large page does not stall
+    # every other request in flight
+
+    def __init__(self, kind: str = PARSE_EXECUTOR, workers: int = PARSE_WORKERS):
+        if kind not in ('process', 'thread', 'inline'):
+            raise ValueError(f"Unknown parse executor {kind!r}")
+        self.kind = kind
+        self.workers = workers
+        self.executor: Optional[Executor] = None
+        self.in_flight = 0
+
+    def start(self):
+        if self.kind == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        elif self.kind == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='parse')
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def run(self, parser: Callable, markup: str, *args):
+        if self.executor is None:
+            return parser(markup, *args)
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, bind(parser, markup, *args))
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers if self.executor is not None else 0, "in_flight": self.in_flight}
+
+
+# Pool used by the page fetchers; replaced with a started pool by the app lifespan
+parse_pool = ParsePool('inline')
+
+
+def parse_timed(parser: Callable, markup: str, *args) -> Tuple[object, Dict[str, List[float]]]:
+    # Runs parser and returns its result with the duration of every timed stage call
+    parse_state.stages = {}
+    try:
+        return parser(markup, *args), parse_state.stages
+    finally:
+        parse_state.stages = None
+
+
+async def parse(parser: Callable, markup: str, *args):
+    # Stage timings are taken wherever the parser runs and observed here, in the app's process
+    start = time.perf_counter()
+    parsed, stages = await parse_pool.run(bind(parse_timed, parser), markup, *args)
+    metrics.record_parse(parser.__name__, time.perf_counter() - start, stages)
+    return parsed
@@ -0,0 +1,170 @@
+import logging
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional
+
+from records import CatalogItem
+
+logger = logging.getLogger(__name__)
+
+# Append-only file price samples are kept in; history is only kept in memory when unset
+PRICE_HISTORY_PATH = os.environ.get('PRICE_HISTORY_PATH')
+# Most buckets a single history query may return
+MAX_HISTORY_BUCKETS = 2000
+
+# One sample on disk: asset id, unix time, Robux, Tickets and the "now" side of price_change
+RECORD = struct.Struct('<IIiii')
+# Stored for prices an item doesn't have
+MISSING = -1
+INT32_MAX = 2 ** 31 - 1
+
+
+def price_value(value: Optional[int]) -> int:
+    return MISSING if value is None else min(value, INT32_MAX)
+
+
+def item_prices(item: CatalogItem):
+    # (Robux, Tickets, now) of a processed catalog item; a Free item is at 0 Robux
+    if item.free:
+        return 0, MISSING, MISSING
+    # The "now" side of a price change is Free (0) when it shows no price
+    now = MISSING if item.price_change is None else item.price_change[1] or 0
+    return price_value(item.robux), price_value(item.tickets), price_value(now)
+
+
+class PriceSeries:
+    # Samples of one asset as parallel arrays, in time order
+
+    __slots__ = ('times', 'robux', 'tickets', 'now')
+
+    def __init__(self):
+        self.times = array('l')
+        self.robux = array('l')
+        self.tickets = array('l')
+        self.now = array('l')
+
+    def append(self, timestamp: int, prices):
+        self.times.append(timestamp)
+        self.robux.append(prices[0])
+        self.tickets.append(prices[1])
+        self.now.append(prices[2])
+
+    def last(self):
+        return self.robux[-1], self.tickets[-1], self.now[-1]
+
+
+def present(values: Iterable[int]) -> List[int]:
+    return [value for value in values if value != MISSING]
+
+
+class PriceHistory:
+    # Append-only price history of catalog items, one series per asset id. A sample
+    # is only stored when an asset's prices differ from its last sample, so a series
+    # is a step function: an asset is at the price of its latest sample until the
+    # next one. Samples are appended to the file at path as fixed-size records.
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.series: Dict[int, PriceSeries] = {}
+        self.file: Optional[BinaryIO] = None
+        self.samples = 0
+
+    def open(self, path: str):
+        # Load the samples already in path and append new ones to it
+        if os.path.exists(path):
+            with open(path, 'rb') as history_file:
+                data = history_file.read()
+            usable = len(data) - len(data) % RECORD.size
+            if usable != len(data):
+                logger.warning(f"Ignoring a truncated record at the end of {path}")
+            for item_id, timestamp, *prices in RECORD.iter_unpack(data[:usable]):
+                self.add(item_id, timestamp, prices)
+            logger.info(f"Loaded {usable // RECORD.size} price samples from {path}")
+        self.file = open(path, 'ab')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def add(self, item_id: int, timestamp: int, prices) -> bool:
+        series = self.series.get(item_id)
+        if series is None:
+            series = self.series[item_id] = PriceSeries()
+        elif series.last() == tuple(prices):
+            return False
+        series.append(max(timestamp, series.times[-1]) if series.times else timestamp, prices)
+        self.samples += 1
+        return True
+
+    def record(self, items: Iterable[Optional[CatalogItem]]):
+        # Record the prices of freshly scraped items
+        timestamp = int(self.clock())
+        records = []
+        for item in items:
+            if item is None or item.asset_id is None:
+                continue
+            prices = item_prices(item)
+            if self.add(item.asset_id, timestamp, prices):
+                records.append(RECORD.pack(item.asset_id, timestamp, *prices))
+
+        if records and self.file is not None:
+            self.file.write(b''.join(records))
+            self.file.flush()
+
+    def history(self, item_id: int, field: str, bucket: int, start: Optional[int] = None,
+                end: Optional[int] = None) -> Optional[List[Dict]]:
+        # Downsample one asset's series into bucket second wide buckets from start to
+        # end: the min, max and last price of each. The price carried into a bucket
+        # counts towards it. Without start, it is the first sample or as far back as
+        # MAX_HISTORY_BUCKETS buckets reach, whichever is later. Returns None if the asset
+        # has no history, and raises ValueError if an explicit start needs more buckets.
+        series = self.series.get(item_id)
+        if series is None:
+            return None
+        times, values = series.times, getattr(series, field)
+
+        end = int(self.clock()) if end is None else end
+        if start is None:
+            start = max(times[0], end - (MAX_HISTORY_BUCKETS - 1) * bucket)
+        start -= start % bucket
+        if (end - start) // bucket >= MAX_HISTORY_BUCKETS:
+            raise ValueError(f"More than {MAX_HISTORY_BUCKETS} buckets requested; use a wider bucket or a shorter range")
+
+        points = []
+        index = bisect_right(times, start - 1)
+        for bucket_start in range(start, end + 1, bucket):
+            bucket_end = bisect_left(times, bucket_start + bucket, index)
+            carried = values[index - 1:index] if index else ()
+            prices = present([*carried, *values[index:bucket_end]])
+            index = bucket_end
+            if not prices and not carried:
+                continue
+            points.append({"start": bucket_start, "min": min(prices, default=None),
+                           "max": max(prices, default=None), "last": prices[-1] if prices else None})
+        return points
+
+    def aggregate(self, item_ids: Iterable[int], field: str, start: Optional[int] = None,
+                  end: Optional[int] = None) -> Dict[int, Dict]:
+        # Price summary (first, last, min, max, change) of each asset between start and
+        # end; assets without history in that window are left out
+        summaries = {}
+        for item_id in item_ids:
+            series = self.series.get(item_id)
+            if series is None:
+                continue
+            times, values = series.times, getattr(series, field)
+            first = bisect_right(times, start) - 1 if start is not None else 0
+            last = bisect_right(times, end) if end is not None else len(times)
+            prices = present(values[max(first, 0):last])
+            if not prices:
+                continue
+            summaries[item_id] = {"first": prices[0], "last": prices[-1], "min": min(prices), "max": max(prices),
+                                  "change": prices[-1] - prices[0], "samples": last - max(first, 0)}
+        return summaries
+
+    def stats(self) -> Dict[str, int]:
+        return {"assets": len(self.series), "samples": self.samples}
@@ -0,0 +1,175 @@
+import re
+from typing import Dict, List, Optional, Tuple, Union
+
+# Catalog and game records as produced by parsing. Numbers are kept as ints and every
+# record renders both the JSON shape the API has always returned (legacy()) and a
+# flat, typed shape (compact()).
+
+
+def legacy_number(value: Optional[int]) -> str:
+    return str(value) if value is not None else "None"
+
+
+def parse_number(value) -> Optional[int]:
+    return int(value) if value not in ('None', None) else None
+
+
+def pass_price(text: str) -> Optional[Union[int, float]]:
+    # Game pass prices are whole Robux, but whatever number the page shows is kept
+    if text.isdigit():
+        return int(text)
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class Record:
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class CatalogItem(Record):
+    # price_change is None when the card shows no change, else (was, now) where None means Free;
+    # limited is None, 'limited' or 'limited u'
+
+    __slots__ = ('name', 'robux', 'tickets', 'price_change', 'limited', 'link', 'image', 'asset_id')
+
+    def __init__(self, name: str, robux: Optional[int], tickets: Optional[int],
+                 price_change: Optional[Tuple[Optional[int], Optional[int]]], limited: Optional[str],
+                 link: Optional[str], image: Optional[str]):
+        self.name = name
+        self.robux = robux
+        self.tickets = tickets
+        self.price_change = price_change
+        self.limited = limited
+        self.link = link
+        self.image = image
+        match = re.search(r'/catalog/(\d+)', link or '')
+        self.asset_id = int(match.group(1)) if match else None
+
+    @property
+    def free(self) -> bool:
+        return self.robux is None and self.tickets is None
+
+    @classmethod
+    def from_legacy(cls, item: Dict) -> 'CatalogItem':
+        price = item['item_price']
+        if price == 'Free':
+            robux = tickets = price_change = None
+        else:
+            robux, tickets = parse_number(price['Robux']), parse_number(price['Tickets'])
+            change = price['price_change']
+            price_change = None if change == 'None' else tuple(
+                None if change[side] == 'Free' else change[side] for side in ('was', 'now'))
+        limited = item['limited_info']['type']
+        return cls(item['item_name'], robux, tickets, price_change, None if limited == 'None' else limited,
+                   item['item_link'], item['item_image'])
+
+    def legacy(self) -> Dict:
+        if self.free:
+            item_price = "Free"
+        else:
+            if self.price_change is None:
+                price_change = "None"
+            else:
+                was, now = self.price_change
+                price_change = {"was": "Free" if was is None else was, "now": "Free" if now is None else now}
+            item_price = {"Robux": legacy_number(self.robux), "Tickets": legacy_number(self.tickets),
+                          "price_change": price_change}
+        return {
+            "item_name": self.name,
+            "item_price": item_price,
+            "limited_info": {"type": self.limited or "None"},
+            "item_link": self.link,
+            "item_image": self.image,
+        }
+
+    def compact(self) -> Dict:
+        was, now = self.price_change or (None, None)
+        return {"id": self.asset_id, "name": self.name, "robux": self.robux, "tickets": self.tickets,
+                "free": self.free, "was": was, "now": now, "limited": self.limited, "link": self.link,
+                "image": self.image}
+
+
+class GamePass(Record):
+    # price_text is the price as shown with everything but digits and dots stripped,
+    # which legacy() returns as is; price is its value, or None if it isn't a number
+
+    __slots__ = ('image', 'name', 'price_text', 'price')
+
+    def __init__(self, image: str, name: str, price_text: str):
+        self.image = image
+        self.name = name
+        self.price_text = price_text
+        self.price = pass_price(price_text)
+
+    def legacy(self) -> Dict:
+        return {'image': self.image, 'name': self.name, 'price': self.price_text}
+
+    def compact(self) -> Dict:
+        return {'image': self.image, 'name': self.name, 'price': self.price}
+
+
+class GameDetails(Record):
+    __slots__ = ('title', 'creator', 'favorites', 'likes', 'dislikes', 'description', 'builders_club',
+                 'thumbnail', 'active_players', 'visits', 'created', 'updated', 'server_size', 'passes')
+
+    def __init__(self, title: str, creator: str, favorites: int, likes: int, dislikes: int, description: str,
+                 builders_club: bool, thumbnail: str, active_players: int, visits: int, created: str, updated: str,
+                 server_size: int, passes: List[GamePass]):
+        self.title = title
+        self.creator = creator
+        self.favorites = favorites
+        self.likes = likes
+        self.dislikes = dislikes
+        self.description = description
+        self.builders_club = builders_club
+        self.thumbnail = thumbnail
+        self.active_players = active_players
+        self.visits = visits
+        self.created = created
+        self.updated = updated
+        self.server_size = server_size
+        self.passes = passes
+
+    @classmethod
+    def from_legacy(cls, game: Dict) -> 'GameDetails':
+        passes = [GamePass(game_pass['image'], game_pass['name'], game_pass['price'])
+                  for game_pass in game['Game Passes']]
+        return cls(game['Game Title'], game['Creator Name'], game['Favorites Count'], game['Likes Count'],
+                   game['Dislikes Count'], game['Description'], game['Builder Club Required'] == 'Yes',
+                   game['Thumbnail Source'], game['Active Players'], game['Visits Count'], game['Created Date'],
+                   game['Updated Date'], game['Server Size'], passes)
+
+    def legacy(self) -> Dict:
+        return {
+            "Game Title": self.title,
+            "Creator Name": self.creator,
+            "Favorites Count": self.favorites,
+            "Likes Count": self.likes,
+            "Dislikes Count": self.dislikes,
+            "Description": self.description,
+            "Builder Club Required": "Yes" if self.builders_club else "No",
+            "Thumbnail Source": self.thumbnail,
+            "Active Players": self.active_players,
+            "Visits Count": self.visits,
+            "Created Date": self.created,
+            "Updated Date": self.updated,
+            "Server Size": self.server_size,
+            "Game Passes": [game_pass.legacy() for game_pass in self.passes],
+        }
+
+    def compact(self) -> Dict:
+        return {"title": self.title, "creator": self.creator, "favorites": self.favorites, "likes": self.likes,
+                "dislikes": self.dislikes, "description": self.description, "builders_club": self.builders_club,
+                "thumbnail": self.thumbnail, "active_players": self.active_players, "visits": self.visits,
+                "created": self.created, "updated": self.updated, "server_size": self.server_size,
+                "passes": [game_pass.compact() for game_pass in self.passes]}
@@ -0,0 +1,370 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, NamedTuple, Optional, Sequence
+from urllib.parse import urlsplit
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, DummyCookieJar, TCPConnector
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings for the shared upstream client
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 32
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+REQUEST_TIMEOUT = 30
+
+
+def default_accept_encoding():
+    # aiohttp only decodes Brotli bodies when a Brotli package is installed
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        return 'gzip, deflate, br'
+    return 'gzip, deflate'
+
+
+# Content codings asked for; bodies are decompressed transparently
+ACCEPT_ENCODING = default_accept_encoding()
+
+# Retry policy (same as the urllib3 Retry the requests based session used)
+RETRY_TOTAL = 3
+RETRY_STATUS_FORCELIST = (500, 502, 503, 504)
+RETRY_BACKOFF_FACTOR = 1
+# Throttled responses are retried too, waiting as long as Retry-After asks (capped)
+RETRY_THROTTLED_STATUSES = (429,)
+RETRY_AFTER_MAX = 120
+
+# Per host token bucket: sustained requests per second and burst size
+HOST_RATE = 20
+HOST_BURST = 40
+# Per host AIMD concurrency limit: grows by one per window of fast successes and
+# halves (at most once per LATENCY_TARGET) on throttling, 5xx, errors or slow responses
+HOST_INITIAL_CONCURRENCY = 8
+HOST_MIN_CONCURRENCY = 1
+HOST_MAX_CONCURRENCY = CONNECTION_LIMIT_PER_HOST
+LATENCY_TARGET = 2.0
+
+# Circuit breaker: open after this many consecutive failures, probe again after the timeout
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+
+class UpstreamError(Exception):
+    # Raised when an upstream page could not be fetched
+
+    def __init__(self, url: str, status: int):
+        super().__init__(f"Failed to fetch {url}. Status Code: {status}")
+        self.url = url
+        self.status = status
+
+
+class UpstreamUnavailable(UpstreamError):
+    # Raised without a request when the host's circuit breaker is open
+
+    def __init__(self, url: str):
+        Exception.__init__(self, f"Not fetching {url}: upstream is failing, circuit breaker open")
+        self.url = url
+        self.status = 503
+
+
+class UpstreamConnectionError(UpstreamError):
+    # Raised when the last attempt at a page got no response (connection error or timeout)
+
+    def __init__(self, url: str, error: BaseException):
+        Exception.__init__(self, f"Failed to fetch {url}: {error!r}")
+        self.url = url
+        self.status = 502
+
+
+class UpstreamResponse(NamedTuple):
+    status: int
+    text: str
+    # Validators for conditional requests, when upstream sent them
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def retry_after(value: Optional[str], now: Callable[[], float] = time.time) -> Optional[float]:
+    # Seconds to wait according to a Retry-After header (delta seconds or an HTTP date)
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - now())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimiter:
+    # Client side throttle for one upstream host: a token bucket bounds the request
+    # rate and an AIMD limit bounds the requests in flight. Throttling, server errors,
+    # connection errors and responses slower than latency_target shrink the limit;
+    # fast successes grow it back. A Retry-After pauses the host altogether.
+
+    def __init__(self, rate: float = HOST_RATE, burst: float = HOST_BURST,
+                 initial_concurrency: float = HOST_INITIAL_CONCURRENCY, min_concurrency: float = HOST_MIN_CONCURRENCY,
+                 max_concurrency: float = HOST_MAX_CONCURRENCY, latency_target: float = LATENCY_TARGET,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.clock = clock
+        self.limit = float(initial_concurrency)
+        self.in_flight = 0
+        self.tokens = float(burst)
+        self.refilled_at = clock()
+        self.paused_until = 0.0
+        self.decreased_at = float('-inf')
+        self.slot_freed = asyncio.Event()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    async def acquire(self):
+        while True:
+            now = self.clock()
+            self.refill(now)
+            if now < self.paused_until:
+                delay = self.paused_until - now
+            elif self.in_flight >= max(1, int(self.limit)):
+                self.slot_freed.clear()
+                await self.slot_freed.wait()
+                continue
+            elif self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+            else:
+                self.tokens -= 1
+                self.in_flight += 1
+                return
+            await asyncio.sleep(delay)
+
+    def release(self, ok: Optional[bool], latency: float):
+        # ok is None when the request was abandoned and says nothing about the host
+        self.in_flight -= 1
+        self.slot_freed.set()
+        if ok is None:
+            return
+
+        if ok and latency <= self.latency_target:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            return
+
+        now = self.clock()
+        if now - self.decreased_at >= self.latency_target:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self.decreased_at = now
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def stats(self) -> Dict[str, float]:
+        return {"concurrency_limit": round(self.limit, 2), "in_flight": self.in_flight,
+                "tokens": round(self.tokens, 2), "paused_for": round(max(0.0, self.paused_until - self.clock()), 2)}
+
+
+class CircuitBreaker:
+    # Closed: requests flow. After failure_threshold consecutive failures it opens and
+    # every request fails fast; reset_timeout later it lets a single probe through
+    # (half open), which closes it on success and opens it again on failure.
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == 'open' and self.clock() - self.opened_at >= self.reset_timeout:
+            self.state = 'half_open'
+        if self.state == 'half_open' and not self.probing:
+            self.probing = True
+            return True
+        if self.state == 'closed':
+            return True
+        self.rejected += 1
+        return False
+
+    def abandon(self):
+        # The request let through was cancelled before it finished
+        self.probing = False
+
+    def record(self, ok: bool):
+        self.probing = False
+        if ok:
+            self.state = 'closed'
+            self.failures = 0
+            return
+
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                logger.warning(f"Upstream failing ({self.failures} consecutive failures), opening the circuit breaker")
+            self.state = 'open'
+            self.opened_at = self.clock()
+
+    def stats(self) -> Dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class UpstreamClient:
+    # One pooled aiohttp session shared by every request for the lifetime of the app.
+    # Cookies and User-Agent differ per caller, so they are sent with each request
+    # instead of being stored on the session, and the cookie jar is disabled so
+    # Set-Cookie headers from one caller never leak into another caller's requests.
+    # Requests to each host go through its HostLimiter and CircuitBreaker.
+
+    def __init__(
+        self,
+        connection_limit: int = CONNECTION_LIMIT,
+        connection_limit_per_host: int = CONNECTION_LIMIT_PER_HOST,
+        dns_cache_ttl: int = DNS_CACHE_TTL,
+        keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+        request_timeout: float = REQUEST_TIMEOUT,
+        retry_total: int = RETRY_TOTAL,
+        retry_status_forcelist: Sequence[int] = RETRY_STATUS_FORCELIST,
+        retry_backoff_factor: float = RETRY_BACKOFF_FACTOR,
+        retry_throttled_statuses: Sequence[int] = RETRY_THROTTLED_STATUSES,
+        host_limiter: Callable[[], HostLimiter] = HostLimiter,
+        circuit_breaker: Callable[[], CircuitBreaker] = CircuitBreaker,
+    ):
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.retry_total = retry_total
+        self.retry_status_forcelist = frozenset(retry_status_forcelist)
+        self.retry_backoff_factor = retry_backoff_factor
+        self.retry_throttled_statuses = frozenset(retry_throttled_statuses)
+        self.host_limiter = host_limiter
+        self.circuit_breaker = circuit_breaker
+        self.hosts: Dict[str, HostLimiter] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.session: Optional[ClientSession] = None
+
+    async def start(self):
+        connector = TCPConnector(
+            limit=self.connection_limit,
+            limit_per_host=self.connection_limit_per_host,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self.session = ClientSession(
+            connector=connector,
+            cookie_jar=DummyCookieJar(),
+            headers={'Accept-Encoding': ACCEPT_ENCODING},
+            timeout=ClientTimeout(total=self.request_timeout),
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def backoff_time(self, retry_number: int) -> float:
+        # urllib3 semantics: the first retry is immediate, then factor * 2 ** (n - 1)
+        if retry_number <= 1:
+            return 0
+        return self.retry_backoff_factor * (2 ** (retry_number - 1))
+
+    def host(self, url: str):
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = self.host_limiter()
+            self.breakers[host] = self.circuit_breaker()
+        return self.hosts[host], self.breakers[host]
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> UpstreamResponse:
+        # Raises UpstreamUnavailable without a request while the host's circuit breaker is open,
+        # and UpstreamConnectionError if the last retry still got no response
+        if self.session is None:
+            raise RuntimeError("UpstreamClient.start() has not been called")
+
+        limiter, breaker = self.host(url)
+        retry_number = 0
+        while True:
+            if not breaker.allow():
+                raise UpstreamUnavailable(url)
+            # Only the half open probe holds the breaker; give it back if this request goes away
+            probe = breaker.state == 'half_open'
+
+            try:
+                await limiter.acquire()
+            except BaseException:
+                if probe:
+                    breaker.abandon()
+                raise
+            start = time.monotonic()
+            try:
+                status, text, wait, validators = await self.fetch(url, headers)
+            except (ClientError, asyncio.TimeoutError) as e:
+                limiter.release(False, time.monotonic() - start)
+                breaker.record(False)
+                if retry_number >= self.retry_total:
+                    raise UpstreamConnectionError(url, e) from e
+                logger.warning(f"Request to {url} failed ({e!r}), retrying")
+            except BaseException:
+                limiter.release(None, 0)
+                if probe:
+                    breaker.abandon()
+                raise
+            else:
+                throttled = status in self.retry_throttled_statuses
+                ok = status < 500 and not throttled
+                limiter.release(ok, time.monotonic() - start)
+                breaker.record(ok)
+
+                if wait is not None and not ok:
+                    # Hold back every request to the host, not just this one
+                    limiter.pause(min(wait, RETRY_AFTER_MAX))
+                if not (throttled or status in self.retry_status_forcelist) or retry_number >= self.retry_total:
+                    return UpstreamResponse(status, text, *validators)
+                logger.warning(f"Request to {url} returned {status}, retrying")
+
+            retry_number += 1
+            await asyncio.sleep(self.backoff_time(retry_number))
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]]):
+        # One request: (status, body, seconds asked to wait by Retry-After, (ETag, Last-Modified))
+        async with self.session.get(url, headers=headers) as response:
+            status = response.status
+            retried = status in self.retry_status_forcelist or status in self.retry_throttled_statuses
+            text = await response.text() if not (retried or status == 304) else ''
+            return (status, text, retry_after(response.headers.get('Retry-After')),
+                    (response.headers.get('ETag'), response.headers.get('Last-Modified')))
+
+    def stats(self) -> Dict[str, Dict]:
+        return {host: dict(limiter.stats(), **self.breakers[host].stats()) for host, limiter in self.hosts.items()}
+
+    def bind(self, headers: Dict[str, str]) -> "BoundUpstream":
+        return BoundUpstream(self, headers)
+
+
+class BoundUpstream:
+    # Per-request view of the shared client that sends the caller's headers with every call
+
+    __slots__ = ('client', 'headers')
+
+    def __init__(self, client: UpstreamClient, headers: Dict[str, str]):
+        self.client = client
+        self.headers = headers
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> UpstreamResponse:
+        # headers are sent on top of the caller's, e.g. to make the request conditional
+        return await self.client.get(url, headers=dict(self.headers, **headers) if headers else self.headers)